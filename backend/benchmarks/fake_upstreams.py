@@ -0,0 +1,333 @@
+"""
+Local stand-ins for Google Places, Google Geocoding, Ticketmaster, OpenAI and the
+Supabase REST API. Responses are replayed from benchmarks/fixtures with
+configurable latency, error rate and 429 throttling per provider.
+
+Run standalone and point the backend at it:
+
+    python benchmarks/fake_upstreams.py --port 9100 --latency openai=1500,places=80
+
+    GOOGLE_PLACES_BASE_URL=http://127.0.0.1:9100 \\
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:9100 \\
+    TICKETMASTER_BASE_URL=http://127.0.0.1:9100 \\
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 \\
+    SUPABASE_URL=http://127.0.0.1:9100 \\
+    uvicorn main:app
+
+benchmarks/load_test.py does this automatically.
+"""
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PROVIDERS = ("places", "geocoding", "ticketmaster", "openai", "supabase")
+
+# Typical latencies (ms) of the real services, used when not overridden
+DEFAULT_LATENCY_MS = {
+    "places": 120,
+    "geocoding": 60,
+    "ticketmaster": 250,
+    "openai": 2500,
+    "supabase": 40,
+}
+
+
+# Pages of events the fake Ticketmaster reports for every date range
+TICKETMASTER_TOTAL_PAGES = 3
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+
+# "openai=1500,places=80" -> {"openai": 1500.0, "places": 80.0}; "0.1" applies to all
+def parse_provider_values(spec: str, defaults: dict = None):
+    values = dict(defaults or {})
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            provider, value = part.split("=", 1)
+            if provider not in PROVIDERS:
+                raise ValueError(f"Unknown provider {provider!r}, expected one of {PROVIDERS}")
+            values[provider] = float(value)
+        else:
+            values.update({provider: float(part) for provider in PROVIDERS})
+    return values
+
+
+class UpstreamBehavior:
+    """Latency, failures and throttling applied to every fake response."""
+
+    def __init__(
+        self,
+        latency_ms: dict = None,
+        jitter: float = 0.2,
+        error_rate: dict = None,
+        rate_limit_rate: dict = None,
+        retry_after_seconds: int = 1,
+        seed: int = None,
+    ):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.jitter = jitter
+        self.error_rate = error_rate or {}
+        self.rate_limit_rate = rate_limit_rate or {}
+        self.retry_after_seconds = retry_after_seconds
+        self.random = random.Random(seed)
+        self.calls = {provider: 0 for provider in PROVIDERS}
+
+    # Sleep for the provider's latency, then return an error response or None
+    async def apply(self, provider: str):
+        self.calls[provider] += 1
+        latency = self.latency_ms.get(provider, 0) / 1000
+        await asyncio.sleep(latency * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+        if self.random.random() < self.rate_limit_rate.get(provider, 0):
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Rate limit exceeded (fake)"}},
+                status_code=429,
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+        if self.random.random() < self.error_rate.get(provider, 0):
+            return JSONResponse(
+                {"error": {"code": 503, "message": "Service unavailable (fake)"}},
+                status_code=503,
+            )
+        return None
+
+
+# Stable per-query variation, so different searches return different place ids
+def query_tag(text: str) -> str:
+    return hashlib.sha1(" ".join(text.lower().split()).encode()).hexdigest()[:8]
+
+
+def create_app(behavior: UpstreamBehavior = None):
+    behavior = behavior or UpstreamBehavior()
+    fixtures = {
+        name: load_fixture(name)
+        for name in (
+            "places_search_text",
+            "ticketmaster_events",
+            "geocode",
+            "openai_itinerary",
+            "openai_food",
+            "openai_explanations",
+            "supabase_user_onboarding",
+            "supabase_itinerary",
+        )
+    }
+    row_ids = itertools.count(1000)
+
+    async def places_search_text(request: Request):
+        error = await behavior.apply("places")
+        if error is not None:
+            return error
+        body = await request.json()
+        tag = query_tag(body.get("textQuery", ""))
+        data = copy.deepcopy(fixtures["places_search_text"])
+        data["places"] = data["places"][: int(body.get("maxResultCount", 5))]
+        for place in data["places"]:
+            place["id"] = f"{place['id']}-{tag}"
+            place["displayName"]["text"] += f" ({body.get('textQuery', '')})"
+        return JSONResponse(data)
+
+    async def geocode(request: Request):
+        error = await behavior.apply("geocoding")
+        if error is not None:
+            return error
+        data = copy.deepcopy(fixtures["geocode"])
+        data["results"][0]["formatted_address"] = request.query_params.get("address", "")
+        return JSONResponse(data)
+
+    # Fixture events spread over the requested date range, one page per request
+    async def ticketmaster_events(request: Request):
+        error = await behavior.apply("ticketmaster")
+        if error is not None:
+            return error
+        params = request.query_params
+        try:
+            start = date.fromisoformat(params.get("startDateTime", "")[:10])
+            end = date.fromisoformat(params.get("endDateTime", "")[:10])
+        except ValueError:
+            start = end = date.today()
+        days = max(1, (end - start).days + 1)
+        page = int(params.get("page", 0))
+        size = int(params.get("size", 10))
+
+        data = copy.deepcopy(fixtures["ticketmaster_events"])
+        events = data["_embedded"]["events"][:size]
+        tag = query_tag(f"{params.get('city', '')}|{start}|{page}")
+        for i, event in enumerate(events):
+            event["id"] = f"{event['id']}-{tag}"
+            event["dates"]["start"]["localDate"] = (start + timedelta(days=i % days)).isoformat()
+        data["_embedded"]["events"] = events
+        data["page"].update(
+            {
+                "size": size,
+                "number": page,
+                "totalElements": size * TICKETMASTER_TOTAL_PAGES,
+                "totalPages": TICKETMASTER_TOTAL_PAGES,
+            }
+        )
+        return JSONResponse(data)
+
+    async def chat_completions(request: Request):
+        error = await behavior.apply("openai")
+        if error is not None:
+            return error
+        body = await request.json()
+        system_prompt = next(
+            (m["content"] for m in body.get("messages", []) if m.get("role") == "system"),
+            "",
+        )
+        if "culinary" in system_prompt:
+            content = fixtures["openai_food"]
+        elif '"explanations"' in system_prompt:
+            content = fixtures["openai_explanations"]
+        else:
+            content = fixtures["openai_itinerary"]
+        text = json.dumps(content)
+        completion_id = f"chatcmpl-fake{next(row_ids)}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            async def chunks():
+                for i in range(0, len(text), 64):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model"),
+                        "choices": [
+                            {"index": 0, "delta": {"content": text[i : i + 64]}, "finish_reason": None}
+                        ],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+    # Just enough of PostgREST for the tables the backend reads and writes
+    async def supabase_table(request: Request):
+        error = await behavior.apply("supabase")
+        if error is not None:
+            return error
+        table = request.path_params["table"]
+        single = "vnd.pgrst.object" in request.headers.get("accept", "")
+
+        if request.method == "POST":
+            rows = await request.json()
+            rows = rows if isinstance(rows, list) else [rows]
+            return JSONResponse([{**row, "id": next(row_ids)} for row in rows], status_code=201)
+        if request.method == "DELETE":
+            return Response(status_code=204)
+
+        if table == "user_onboarding":
+            row = {
+                **fixtures["supabase_user_onboarding"],
+                "user_id": request.query_params.get("user_id", "eq.")[3:],
+            }
+        elif table == "itineraries":
+            row = fixtures["supabase_itinerary"]
+        else:
+            row = None
+        if single:
+            return JSONResponse(row) if row else JSONResponse(
+                {"code": "PGRST116", "message": "No rows found", "details": None, "hint": None},
+                status_code=406,
+            )
+        return JSONResponse([row] if row else [])
+
+    async def stats(request: Request):
+        return JSONResponse({"calls": behavior.calls})
+
+    return Starlette(
+        routes=[
+            Route("/v1/places:searchText", places_search_text, methods=["POST"]),
+            Route("/maps/api/geocode/json", geocode),
+            Route("/discovery/v2/events.json", ticketmaster_events),
+            Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+            Route("/rest/v1/{table}", supabase_table, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/_stats", stats),
+        ]
+    )
+
+
+# Environment that points the backend at a fake server on this base URL
+def upstream_env(base_url: str):
+    return {
+        "GOOGLE_PLACES_BASE_URL": base_url,
+        "GOOGLE_MAPS_BASE_URL": base_url,
+        "TICKETMASTER_BASE_URL": base_url,
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "SUPABASE_URL": base_url,
+    }
+
+
+def add_behavior_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="", help="ms per provider, e.g. openai=1500,places=80")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter, +- fraction")
+    parser.add_argument("--error-rate", default="", help="5xx probability, e.g. places=0.05 or 0.01")
+    parser.add_argument("--rate-limit-rate", default="", help="429 probability, e.g. ticketmaster=0.2")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def behavior_from_args(args) -> UpstreamBehavior:
+    return UpstreamBehavior(
+        latency_ms=parse_provider_values(args.latency),
+        jitter=args.jitter,
+        error_rate=parse_provider_values(args.error_rate),
+        rate_limit_rate=parse_provider_values(args.rate_limit_rate),
+        retry_after_seconds=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(behavior_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare the single embedded-select fetch used by /fetch-itinerary with the old
+three-query path (itinerary, then days, then activities) against a real Supabase
+project. Needs the backend .env (SUPABASE_URL, SUPABASE_ANON_KEY, ...) and a saved
+itinerary.
+
+    cd backend && python benchmarks/fetch_itinerary.py USER_ID ITINERARY_ID [--runs 30]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import fetch_itinerary_rows, shape_itinerary, supabase  # noqa: E402
+
+
+# The previous implementation: three sequential requests, regrouped in Python
+def three_query_fetch(user_id, itinerary_id):
+    supabase.from_("itineraries").select("*").eq("id", itinerary_id).eq(
+        "user_id", user_id
+    ).single().execute()
+    days = (
+        supabase.from_("itinerary_days")
+        .select("*")
+        .eq("itinerary_id", itinerary_id)
+        .order("day_number")
+        .execute()
+        .data
+        or []
+    )
+    if not days:
+        return shape_itinerary([])
+    activities = (
+        supabase.from_("activities")
+        .select("*")
+        .in_("day_id", [day["id"] for day in days])
+        .order("start_time")
+        .execute()
+        .data
+        or []
+    )
+    by_day = {}
+    for activity in activities:
+        by_day.setdefault(activity["day_id"], []).append(activity)
+    return shape_itinerary([{**day, "activities": by_day.get(day["id"], [])} for day in days])
+
+
+def embedded_fetch(user_id, itinerary_id):
+    rows = fetch_itinerary_rows(user_id, itinerary_id)
+    return shape_itinerary(rows.get("itinerary_days") or [])
+
+
+def measure(fn, runs, *args):
+    fn(*args)  # warm the connection
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("user_id")
+    parser.add_argument("itinerary_id")
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    old, old_ms = measure(three_query_fetch, args.runs, args.user_id, args.itinerary_id)
+    new, new_ms = measure(embedded_fetch, args.runs, args.user_id, args.itinerary_id)
+    if old != new:
+        print("WARNING: the two paths returned different itineraries")
+
+    print(f"{'path':<12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, timings in (("3 queries", old_ms), ("embedded", new_ms)):
+        print(
+            f"{name:<12} {np.percentile(timings, 50):>8.1f} "
+            f"{np.percentile(timings, 95):>8.1f} {timings.mean():>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline load test: runs the API against the local stand-ins from fake_upstreams.py
+and drives its endpoints at controlled concurrency. No API keys or network needed.
+
+    cd backend && python benchmarks/load_test.py \\
+        --endpoints generate-itinerary,geocode --concurrency 1,10,50 --requests 100 \\
+        --latency openai=800,places=100 --rate-limit-rate places=0.05
+
+Reports throughput and latency percentiles per endpoint and concurrency level.
+
+Sync vs async generation (GENERATION_MODE) at high concurrency. --pool-size raises
+the provider connection pools so they are not the first limit, and the fake
+upstreams run in their own process so they do not compete with the API for the GIL:
+
+    python benchmarks/fake_upstreams.py --port 9100 --latency openai=1000 &
+    python benchmarks/load_test.py --upstream-url http://127.0.0.1:9100 \\
+        --endpoints generate-itinerary --concurrency 10,100,500 --requests 1000 \\
+        --pool-size 64 --mode async
+
+Caches are cleared before every level; requests set no_cache and rotate through
+--destinations / --users so the LLM, profile and Places caches do not hide the
+upstream work unless --warm is given.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import (  # noqa: E402
+    add_behavior_arguments,
+    behavior_from_args,
+    create_app,
+    parse_provider_values,
+    upstream_env,
+)
+
+# Env prefix of each provider's rate-limit budget (ratelimit.py)
+QPS_ENV_PREFIXES = {
+    "places": "PLACES",
+    "geocoding": "GEOCODING",
+    "ticketmaster": "TICKETMASTER",
+    "openai": "OPENAI",
+}
+
+ENDPOINTS = (
+    "generate-itinerary",
+    "generate-food",
+    "regenerate-itinerary",
+    "fetch-itinerary",
+    "geocode",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Run an ASGI app with uvicorn in a daemon thread and wait until it accepts requests
+def serve_in_thread(app, port: int):
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.02)
+    return server
+
+
+def trip_body(i: int, args):
+    return {
+        "user_id": f"load-user-{i % args.users}",
+        "destination": f"Test City {i % args.destinations}",
+        "start_date": "2025-01-01",
+        "end_date": "2025-01-03",
+        "num_guests": "2 adults, 0 children, 0 infants, 0 pets",
+        "no_cache": not args.warm,
+    }
+
+
+def regenerate_body(i: int, args):
+    with open(os.path.join(BACKEND_DIR, "benchmarks", "fixtures", "openai_itinerary.json")) as f:
+        previous = json.load(f)["itinerary"]
+    body = trip_body(i, args)
+    body.pop("num_guests")
+    return {
+        **body,
+        "chat_messages": [{"sender": "user", "text": "More museums, fewer concerts."}],
+        "approvals": [
+            {"day": day["date"], "index": index, "title": item["title"], "decision": "yes"}
+            for day in previous
+            for index, item in enumerate(day["items"])
+        ],
+        "previous_itinerary": previous,
+    }
+
+
+# (method, path, kwargs) for request i of an endpoint
+def build_request(endpoint: str, i: int, args):
+    if endpoint in ("generate-itinerary", "generate-food"):
+        return "POST", f"/{endpoint}", {"json": trip_body(i, args)}
+    if endpoint == "regenerate-itinerary":
+        return "POST", "/regenerate-itinerary", {"json": regenerate_body(i, args)}
+    if endpoint == "fetch-itinerary":
+        body = {"user_id": f"load-user-{i % args.users}", "itinerary_id": i % args.destinations}
+        return "POST", "/fetch-itinerary", {"json": body}
+    if endpoint == "geocode":
+        return "GET", "/geocode", {"params": {"address": f"{i} Main St, Test City"}}
+    raise ValueError(f"Unknown endpoint {endpoint!r}")
+
+
+async def run_level(base_url: str, endpoint: str, concurrency: int, args):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], []
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    ) as client:
+
+        async def one(i):
+            method, path, kwargs = build_request(endpoint, i, args)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    statuses.append(response.status_code)
+                except httpx.HTTPError as e:
+                    statuses.append(type(e).__name__)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    ok = sum(1 for s in statuses if s == 200)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(statuses),
+        "ok": ok,
+        "errors": {str(s): statuses.count(s) for s in set(statuses) if s != 200},
+        "throughput_rps": round(len(statuses) / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 1),
+        "max_ms": round(float(latencies_ms.max()), 1),
+    }
+
+
+def print_report(results: list, out):
+    header = f"{'endpoint':<22}{'conc':>5}{'ok':>6}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for r in results:
+        errors = sum(r["errors"].values())
+        print(
+            f"{r['endpoint']:<22}{r['concurrency']:>5}{r['ok']:>6}{errors:>6}"
+            f"{r['throughput_rps']:>9.2f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+            f"{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}",
+            file=out,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the Itinera API")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per level")
+    parser.add_argument("--destinations", type=int, default=16)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--warm", action="store_true", help="keep caches between requests and levels")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the API's own logging")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="GENERATION_MODE")
+    parser.add_argument("--pool-size", type=int, help="connections per provider client")
+    parser.add_argument("--upstream-url", help="use an already running fake_upstreams.py server")
+    parser.add_argument(
+        "--qps", default="", help="provider QPS budgets, e.g. places=10 (default: unlimited)"
+    )
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    if args.upstream_url:
+        upstream_url = args.upstream_url.rstrip("/")
+
+        def upstream_calls():
+            return httpx.get(f"{upstream_url}/_stats").json()["calls"]
+
+    else:
+        behavior = behavior_from_args(args)
+        fake_port = free_port()
+        serve_in_thread(create_app(behavior), fake_port)
+        upstream_url = f"http://127.0.0.1:{fake_port}"
+
+        def upstream_calls():
+            return dict(behavior.calls)
+
+    # Point every upstream at the fake server before the API modules are imported
+    os.environ.update(upstream_env(upstream_url))
+    os.environ.setdefault("SUPABASE_ANON_KEY", "offline-benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("GOOGLE_PLACES_API_KEY", "offline-benchmark")
+    os.environ.setdefault("TICKETMASTER_API_KEY", "offline-benchmark")
+    os.environ["GEOCODE_CACHE_SQLITE_PATH"] = ""
+    os.environ["TRACE_LOG"] = "1" if args.verbose else "0"
+    os.environ["GENERATION_MODE"] = args.mode
+    # The fakes have no quota, so budgets are off unless asked for
+    qps = parse_provider_values(args.qps)
+    for provider, prefix in QPS_ENV_PREFIXES.items():
+        os.environ[f"{prefix}_QPS"] = str(qps.get(provider, 0))
+    if args.pool_size:
+        for name in ("PLACES_POOL_SIZE", "GEOCODING_POOL_SIZE", "TICKETMASTER_POOL_SIZE", "OPENAI_POOL_SIZE"):
+            os.environ[name] = str(args.pool_size)
+
+    report = sys.stdout
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+        import main as api
+        from cache import CACHES
+
+        app_port = free_port()
+        serve_in_thread(api.app, app_port)
+        base_url = f"http://127.0.0.1:{app_port}"
+
+        results = []
+        for endpoint in endpoints:
+            for concurrency in levels:
+                if not args.warm:
+                    for cache in CACHES.values():
+                        cache.clear()
+                calls_before = upstream_calls()
+                result = asyncio.run(run_level(base_url, endpoint, concurrency, args))
+                calls_after = upstream_calls()
+                result["upstream_calls"] = {
+                    p: calls_after[p] - calls_before[p]
+                    for p in calls_after
+                    if calls_after[p] != calls_before[p]
+                }
+                results.append(result)
+                print(
+                    f"{endpoint} x{concurrency}: {result['throughput_rps']} rps, "
+                    f"p95 {result['p95_ms']} ms",
+                    file=report,
+                )
+
+    print(file=report)
+    print_report(results, report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
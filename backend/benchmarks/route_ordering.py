@@ -0,0 +1,85 @@
+"""
+Benchmark for routing.order_day_items on synthetic days.
+
+Each day has random stops inside a ~10 km city box, one or two of them fixed-time,
+and some evening-type items. Days of 2-4 items (the relaxed / balanced / fast paces)
+use the scheduler's slot times. Reports solve time and route length before / after.
+
+    cd backend && python benchmarks/route_ordering.py [--days 200] [--seed 7]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import ROUTE_EXACT_MAX_ITEMS, order_day_items, route_length_km  # noqa: E402
+from scheduler import SLOT_TIMES  # noqa: E402
+
+
+CITY_CENTER = (48.8566, 2.3522)
+CITY_SPREAD_DEGREES = 0.05
+DAY_SIZES = [2, 3, 4, 6, 8, 10, 12]
+
+
+def slot_times(n):
+    # The app's own slots for its 2-4 item paces, evenly spaced from 9:00 AM to
+    # 9:00 PM for larger days
+    if n in SLOT_TIMES:
+        return list(SLOT_TIMES[n])
+    minutes = np.linspace(9 * 60, 21 * 60, n).astype(int)
+    return [f"{m // 60 % 12 or 12}:{m % 60:02d} {'AM' if m < 720 else 'PM'}" for m in minutes]
+
+
+def random_day(rng, n):
+    times = slot_times(n)
+    fixed = set(rng.choice(n, size=min(n // 4, 2), replace=False).tolist())
+    items = []
+    for i in range(n):
+        evening = i >= n - 1 and rng.random() < 0.5
+        items.append(
+            {
+                "time": times[i],
+                "time_is_fixed": i in fixed,
+                "title": f"{'jazz bar' if evening else 'museum'} {i}",
+                "lat": CITY_CENTER[0] + rng.uniform(-1, 1) * CITY_SPREAD_DEGREES,
+                "lng": CITY_CENTER[1] + rng.uniform(-1, 1) * CITY_SPREAD_DEGREES,
+            }
+        )
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"exact solver up to {ROUTE_EXACT_MAX_ITEMS} flexible items, {args.days} days per size")
+    print(f"{'items':>5} {'mean ms':>8} {'p95 ms':>8} {'km before':>10} {'km after':>9} {'saved':>6}")
+    for n in DAY_SIZES:
+        days = [random_day(rng, n) for _ in range(args.days)]
+        order_day_items(days[0])  # warm the permutation table
+
+        timings, before, after = [], [], []
+        for items in days:
+            started = time.perf_counter()
+            reordered = order_day_items(items)
+            timings.append((time.perf_counter() - started) * 1000)
+            before.append(route_length_km(items))
+            after.append(route_length_km(reordered))
+
+        saved = 1 - sum(after) / sum(before) if sum(before) else 0.0
+        print(
+            f"{n:>5} {np.mean(timings):>8.2f} {np.percentile(timings, 95):>8.2f} "
+            f"{np.mean(before):>10.2f} {np.mean(after):>9.2f} {saved:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# Every cache registers itself here so their counters can be reported together
+CACHES = {}
+
+
+# Approximate memory cost of a cached value, in bytes
+def estimate_size(value) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with a per-entry TTL, LRU eviction and a byte budget.
+    If sqlite_path is set, entries are also written to an on-disk SQLite tier that
+    survives restarts (values must then be JSON serializable).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> (value, expires_at, size)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.db = None
+        if sqlite_path:
+            self.db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "cache TEXT, key TEXT, value TEXT, expires_at REAL, "
+                "PRIMARY KEY (cache, key))"
+            )
+            self.db.execute(
+                "DELETE FROM cache_entries WHERE cache = ? AND expires_at < ?",
+                (name, time.time()),
+            )
+            self.db.commit()
+        CACHES[name] = self
+
+    def get(self, key: str):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM cache_entries WHERE cache = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row and row[1] > now:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value, ttl_seconds: Optional[float] = None):
+        expires_at = time.time() + (
+            self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        )
+        with self.lock:
+            self._store(key, value, expires_at)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (cache, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(value), expires_at),
+                )
+                self.db.commit()
+
+    # Seconds until key expires (either tier), or None if it is not cached.
+    # Does not count as a lookup.
+    def expires_in(self, key: str):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[1] - now
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT expires_at FROM cache_entries WHERE cache = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row and row[0] > now:
+                    return row[0] - now
+            return None
+
+    def delete(self, key: str):
+        with self.lock:
+            self._remove(key)
+            if self.db is not None:
+                self.db.execute(
+                    "DELETE FROM cache_entries WHERE cache = ? AND key = ?",
+                    (self.name, key),
+                )
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            if self.db is not None:
+                self.db.execute(
+                    "DELETE FROM cache_entries WHERE cache = ?", (self.name,)
+                )
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_tier": self.db is not None,
+            }
+
+    # Callers must hold self.lock
+    def _store(self, key: str, value, expires_at: float):
+        self._remove(key)
+        size = estimate_size(value)
+        self.entries[key] = (value, expires_at, size)
+        self.total_bytes += size
+        # Evict least recently used entries until both budgets are met
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+def cache_stats():
+    return {name: c.stats() for name, c in CACHES.items()}
@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+
+from metrics import registry
+
+
+# Generations that run at once. Each worker is a thread running one sync pipeline.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Jobs waiting for a worker before new ones are turned away with 503
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+
+# Queued + running jobs one user may have before new ones are turned away with 429
+JOB_MAX_PENDING_PER_USER = int(os.getenv("JOB_MAX_PENDING_PER_USER", "3"))
+
+# How long finished jobs (and their results) can still be fetched
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+
+# Assumed job duration until real ones have been measured, for Retry-After
+JOB_INITIAL_SECONDS = float(os.getenv("JOB_INITIAL_SECONDS", "15"))
+
+# Lower runs first. Regeneration is interactive (the user is editing), new trips can wait.
+JOB_PRIORITIES = {
+    "regenerate-itinerary": 0,
+    "generate-itinerary": 1,
+    "generate-food": 1,
+    "generate-trip": 1,
+}
+
+
+class JobRejected(Exception):
+    """Admission control turned a job away; retry_after is in seconds."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, kind: str, user_id: str, run):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.priority = JOB_PRIORITIES.get(kind, max(JOB_PRIORITIES.values()))
+        self.run = run
+        # (priority, user round, arrival), set when the job is queued
+        self.queue_key = None
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self, position=None):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if position is not None:
+            data["position"] = position
+        if self.status == "succeeded":
+            data["result"] = self.result
+        if self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Bounded worker pool for LLM generations.
+
+    Jobs are ordered by (priority, user round, arrival): a user's second pending
+    job queues behind every other user's first, so one client submitting a burst
+    cannot starve the rest. Enqueueing never blocks; a full queue or too many jobs
+    for one user raise JobRejected with an estimated Retry-After.
+    """
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_MAX_QUEUED,
+        max_pending_per_user: int = JOB_MAX_PENDING_PER_USER,
+        result_ttl_seconds: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_pending_per_user = max_pending_per_user
+        self.result_ttl_seconds = result_ttl_seconds
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.heap = []
+        self.sequence = itertools.count()
+        self.jobs = {}
+        self.pending_per_user = {}
+        self.running = 0
+        self.average_seconds = JOB_INITIAL_SECONDS
+        self.completed = 0
+        self.rejected = 0
+        self.threads = []
+
+    # Seconds until a new job would likely start, from the queue depth and the
+    # average job duration
+    def estimate_wait(self) -> int:
+        waves = (len(self.heap) + self.running) / max(1, self.workers)
+        return min(300, max(1, math.ceil(waves * self.average_seconds)))
+
+    def submit(self, kind: str, user_id: str, run):
+        with self.lock:
+            self.prune()
+            if len(self.heap) >= self.max_queued:
+                self.rejected += 1
+                raise JobRejected(503, "Too many generations queued", self.estimate_wait())
+            pending = self.pending_per_user.get(user_id, 0)
+            if pending >= self.max_pending_per_user:
+                self.rejected += 1
+                raise JobRejected(
+                    429,
+                    f"At most {self.max_pending_per_user} generations per user at a time",
+                    max(1, math.ceil(self.average_seconds)),
+                )
+
+            job = Job(kind, user_id, run)
+            self.jobs[job.id] = job
+            self.pending_per_user[user_id] = pending + 1
+            job.queue_key = (job.priority, pending, next(self.sequence))
+            heapq.heappush(self.heap, (job.queue_key, job))
+            self.start_workers()
+            self.available.notify()
+            return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            self.prune()
+            return self.jobs.get(job_id)
+
+    # Number of queued jobs that will run before this one (None once it started)
+    def position(self, job: Job):
+        with self.lock:
+            if job.status != "queued":
+                return None
+            return sum(1 for key, _ in self.heap if key < job.queue_key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queued": len(self.heap),
+                "running": self.running,
+                "workers": self.workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    # Drop finished jobs whose results have expired. Caller holds the lock.
+    def prune(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    # Workers start with the first job, so the API pays nothing unless jobs are used.
+    # Caller holds the lock.
+    def start_workers(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(
+                target=self.work, name=f"job-worker-{len(self.threads)}", daemon=True
+            )
+            self.threads.append(thread)
+            thread.start()
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.heap:
+                    self.available.wait()
+                _, job = heapq.heappop(self.heap)
+                job.status = "running"
+                job.started_at = time.time()
+                self.running += 1
+            registry.observe("stage", {"stage": "job_wait"}, job.started_at - job.created_at)
+
+            try:
+                job.result = job.run()
+                job.status = "succeeded"
+            except Exception as e:
+                # HTTPException from the pipeline keeps its status and detail
+                print(f"[JOBS] {job.kind} job {job.id} failed: {e!r}")
+                job.error = {
+                    "status_code": getattr(e, "status_code", 500),
+                    "detail": getattr(e, "detail", "Generation failed"),
+                }
+                job.status = "failed"
+            finally:
+                job.run = None
+                job.finished_at = time.time()
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                    remaining = self.pending_per_user.get(job.user_id, 1) - 1
+                    if remaining > 0:
+                        self.pending_per_user[job.user_id] = remaining
+                    else:
+                        self.pending_per_user.pop(job.user_id, None)
+                    self.average_seconds = 0.8 * self.average_seconds + 0.2 * (
+                        job.finished_at - job.started_at
+                    )
+                job.done.set()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,102 @@
+import json
+import re
+
+
+CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_code_fences(text: str) -> str:
+    return CODE_FENCE.sub("", text)
+
+
+# Drop commas that directly precede a closing brace or bracket
+def remove_trailing_commas(text: str) -> str:
+    out = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[i + 1 :].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort fix-up of LLM JSON: strips markdown fences and text around the root
+    value, removes trailing commas, and closes output that was cut off mid-way by
+    keeping everything up to the last completed object or array.
+    """
+    text = strip_code_fences(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    text = text[min(starts) :]
+
+    stack = []
+    in_string = False
+    escaped = False
+    end = None
+    last_close = None
+    stack_at_last_close = []
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]" and stack:
+            stack.pop()
+            last_close = i
+            stack_at_last_close = list(stack)
+            if not stack:
+                end = i
+                break
+
+    if end is not None:
+        body = text[: end + 1]
+    elif last_close is not None:
+        # Truncated: keep the completed part and close what is still open
+        body = text[: last_close + 1] + "".join(
+            CLOSERS[c] for c in reversed(stack_at_last_close)
+        )
+    else:
+        body = text + ('"' if in_string else "") + "".join(
+            CLOSERS[c] for c in reversed(stack)
+        )
+
+    return remove_trailing_commas(body)
+
+
+# json.loads, falling back to repair_json when the raw text is not valid JSON
+def parse_llm_json(text: str):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+    repaired = repair_json(text or "")
+    data = json.loads(repaired)
+    print(f"[LLM JSON] Repaired malformed output ({len(text or '')} -> {len(repaired)} chars)")
+    return data
@@ -0,0 +1,120 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+from cache import TTLCache
+
+
+# Stable content hash of everything that determines a completion
+def llm_cache_key(model: str, temperature: float, messages: list, response_format=None):
+    canonical = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": messages,
+            "response_format": response_format,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Caches parsed LLM results by content hash. Identical requests that arrive while
+    the first one is still running wait for its result instead of starting another
+    completion. A bypass request (no_cache) always runs its own completion; its
+    result still replaces the cached one.
+    """
+
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        # Only touched from the event loop thread
+        self.async_in_flight = {}
+        self.coalesced = 0
+
+    def get_or_compute(self, key: str, compute, bypass: bool = False):
+        if bypass:
+            result = compute()
+            self.cache.set(key, result)
+            return copy.deepcopy(result)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = compute()
+            self.cache.set(key, result)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+        return copy.deepcopy(result)
+
+    # Same as get_or_compute for the async generation mode; compute is a coroutine
+    # function. Waiters share an asyncio future, so no thread is held while waiting.
+    async def get_or_compute_async(self, key: str, compute, bypass: bool = False):
+        if bypass:
+            result = await compute()
+            self.cache.set(key, result)
+            return copy.deepcopy(result)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        future = self.async_in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self.async_in_flight[key] = future
+        try:
+            result = await compute()
+            self.cache.set(key, result)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self.async_in_flight.pop(key, None)
+
+        return copy.deepcopy(result)
+
+
+llm_response_cache = LLMResponseCache(
+    TTLCache(
+        "llm_responses",
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "900")),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    )
+)
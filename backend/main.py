@@ -1,19 +1,63 @@
+import asyncio
+import base64
+import hashlib
+import math
 import os
 import time
-import requests
+import uuid
 import uvicorn
-from datetime import datetime
-from fastapi import FastAPI, Query, HTTPException
+from datetime import date, datetime, timedelta
+from fastapi import FastAPI, Header, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Optional, Dict
-from supabase import create_client, Client
+from supabase import AsyncClient, acreate_client, create_client, Client
+from postgrest import APIError, SyncPostgrestClient
+from starlette.concurrency import run_in_threadpool
 
 # from openai import OpenAI  # Changed import
 from dotenv import load_dotenv
-from openai import OpenAI
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from cache import TTLCache, cache_stats
+from openai import RateLimitError
+from ratelimit import RateLimitExceeded
+from jobs import JobRejected, job_queue
+from prewarm import (
+    PREWARM_ENABLED,
+    Prewarmer,
+    record_destination,
+    record_food_preferences,
+)
+from metrics import count_error, current_trace, log_trace, propagate, registry, span
+from providers import (
+    async_openai_client,
+    close_async_clients,
+    close_clients,
+    geocode_address,
+    geocode_lat_lng,
+    openai_client,
+    openai_limiter,
+    search_places_text,
+    search_places_text_async,
+    search_ticketmaster_events,
+    search_ticketmaster_events_async,
+)
+from stream_json import ItineraryStreamParser
+from json_repair import parse_llm_json
+from llm_cache import llm_cache_key, llm_response_cache
+from ranking import prune_event_pool, prune_food_pool
+from routing import optimize_itinerary_routes
+from scheduler import default_explanation, schedule_itinerary
+from payload_encoder import (
+    compact_event_pool,
+    compact_food_pool,
+    encode_payload,
+    payload_token_report,
+)
 
 
 load_dotenv()
@@ -46,8 +90,34 @@ supabase: Client = create_client(
     os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_ANON_KEY")
 )
 
-# OpenAI setup
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI setup (pooled client shared with the other providers)
+client = openai_client
+
+# Max number of provider searches that run at the same time for one request
+PROVIDER_MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "8"))
+
+
+# Run fn over every item concurrently and return the results in input order
+def fan_out(fn, items, max_workers: int = PROVIDER_MAX_CONCURRENCY):
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(propagate(fn), items))
+
+
+@app.on_event("startup")
+def start_prewarmer():
+    if PREWARM_ENABLED:
+        prewarmer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_provider_clients():
+    prewarmer.stop()
+    close_clients()
+    await close_async_clients()
 
 
 @app.get("/")
@@ -55,6 +125,69 @@ def read_root():
     return {"message": "FastAPI backend running!"}
 
 
+# Hit/miss counters for the in-process caches
+@app.get("/cache-stats")
+def get_cache_stats():
+    return cache_stats()
+
+
+# Time every request by its route and print its spans as one [TRACE] line.
+# Streaming responses are timed until their headers are sent.
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    trace = []
+    token = current_trace.set(trace)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_trace.reset(token)
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        labels = {"endpoint": endpoint, "method": request.method, "status": str(status)}
+        registry.observe("request", labels, elapsed)
+        if status >= 500:
+            registry.count_error("request", labels, "error")
+        if endpoint != "/metrics":
+            log_trace(endpoint, status, elapsed, trace)
+
+
+# A provider budget (ratelimit.py) that would keep the request waiting too long
+@app.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)},
+    )
+
+
+# Latency histograms and quantiles per endpoint, upstream provider and pipeline
+# stage, error/timeout counters and cache counters, in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(
+        registry.render(cache_stats(), job_queue.stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# Chat completion, timed as an OpenAI upstream call. The SDK retries 429s itself;
+# the limiter adds the shared QPS budget and pauses other callers on a final 429.
+def create_completion(operation: str, **kwargs):
+    openai_limiter.wait(operation)
+    try:
+        with span("upstream", provider="openai", operation=operation):
+            return client.chat.completions.create(**kwargs)
+    except RateLimitError as e:
+        openai_limiter.throttled(e.response)
+        raise
+
+
 # Itinerary Generation
 class TripDetails(BaseModel):
     user_id: str
@@ -62,6 +195,14 @@ class TripDetails(BaseModel):
     start_date: str
     end_date: str
     num_guests: str
+    # "llm" or "local"; defaults to the ITINERARY_SCHEDULER setting
+    scheduler: Optional[str] = None
+    # Skip the LLM response cache and generate a fresh result
+    no_cache: bool = False
+    # Add lat/lng from the provider data to every returned item
+    include_coordinates: bool = False
+    # Reorder each day's flexible items (daytime and evening apart) to shorten the route
+    optimize_route: bool = True
 
 
 class FetchItineraryRequest(BaseModel):
@@ -69,6 +210,30 @@ class FetchItineraryRequest(BaseModel):
     itinerary_id: int
 
 
+class GeocodeBatchRequest(BaseModel):
+    addresses: list[str]
+
+
+class SaveItineraryRequest(BaseModel):
+    user_id: str
+    destination: str
+    start_date: Optional[str]
+    end_date: Optional[str]
+    num_guests: str = ""
+    # Days as returned by /generate-itinerary; items may already carry lat/lng
+    itinerary: list[dict]
+    food_recommendations: list[dict] = []
+
+
+class InvalidateProfileRequest(BaseModel):
+    user_id: str
+
+
+class InvalidateItineraryRequest(BaseModel):
+    user_id: str
+    itinerary_id: int
+
+
 class UserProfile(BaseModel):
     user_id: str
     age_range: str
@@ -94,6 +259,8 @@ class ItineraryEvent(BaseModel):
     priceLevel: Optional[str]
     url: Optional[str]
     time_is_fixed: bool
+    lat: Optional[float] = None
+    lng: Optional[float] = None
 
 
 class FoodPlace(BaseModel):
@@ -104,6 +271,44 @@ class FoodPlace(BaseModel):
     rating: Optional[float]
     priceLevel: Optional[str]
     url: Optional[str]
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+
+
+# Shapes the LLM must return. Used for the structured-output schema and to validate replies.
+class ItineraryItem(BaseModel):
+    time: Optional[str] = None
+    time_is_fixed: bool = False
+    title: str
+    type: str = "event"
+    source: str = "Google"
+    address: str = ""
+    url: Optional[str] = ""
+    explanation: str = ""
+
+
+class ItineraryDay(BaseModel):
+    day_id: int
+    date: Optional[str] = None
+    items: list[ItineraryItem]
+
+
+class ItineraryResponse(BaseModel):
+    itinerary: list[ItineraryDay]
+
+
+class FoodRecommendation(BaseModel):
+    title: str
+    type: str = ""
+    address: str = ""
+    rating: Optional[float] = None
+    priceLevel: Optional[str] = None
+    url: Optional[str] = ""
+    explanation: str = ""
+
+
+class FoodResponse(BaseModel):
+    food_recommendations: list[FoodRecommendation]
 
 
 class ChatMessage(BaseModel):
@@ -126,6 +331,24 @@ class RegenerateRequest(BaseModel):
     chat_messages: list[ChatMessage]
     approvals: list[ApprovalResult]
     previous_itinerary: list[dict]
+    pool_id: Optional[str] = None
+    no_cache: bool = False
+    include_coordinates: bool = False
+    # Off by default so items the user approved keep the slots they approved them in
+    optimize_route: bool = False
+
+
+# Trip fields the LLM needs; ids and request options are left out
+def llm_trip_details(trip: TripDetails):
+    return trip.dict(
+        exclude={
+            "user_id",
+            "scheduler",
+            "no_cache",
+            "include_coordinates",
+            "optimize_route",
+        }
+    )
 
 
 def pretty_print_event(event: ItineraryEvent):
@@ -211,33 +434,57 @@ def pretty_print_food_recommendations(food_json: dict):
     print("================== END FOOD RECOMMENDATIONS ==================\n")
 
 
+# Parsed onboarding profiles, so the reads of one generation burst (trip, retries,
+# a quick regenerate) cost one Supabase read. Each instance has its own copy and
+# /invalidate-profile only clears the instance that receives it, so the TTL is short:
+# after a profile edit, other instances may use the old preferences for up to a minute.
+profile_cache = TTLCache(
+    "profiles",
+    ttl_seconds=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60")),
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "5000")),
+)
+
+
+# user_onboarding row -> UserProfile
+def profile_from_row(user_id: str, user: dict):
+    return UserProfile(
+        user_id=user_id,
+        age_range=user["age_range"],
+        gender=user["gender"],
+        home_location=user["home_location"],
+        travel_mode=user["preferred_travel_mode"],
+        preferred_pace=user["preferred_pace"],
+        interests=user["interests"],
+        diet_preferences=user["dietary_restrictions"],
+        food_preferences=user["food_preferences"] or "",
+        accessibility=user["accessibility"],
+        budget=user["budget_range"],
+    )
+
+
 # STEP 1: Get user travel preferences from supabase (user onboarding)
+@span("stage", stage="profile")
 def get_user_onboarding_profile(user_id: str):
+    cached_profile = profile_cache.get(user_id)
+    if cached_profile is not None:
+        print(f"[STEP 1] Using cached user profile for user_id={user_id}")
+        return cached_profile
+
     print(f"[STEP 1] Fetching user profile for user_id={user_id}")
     try:
-        response = (
-            supabase.from_("user_onboarding")
-            .select("*")
-            .eq("user_id", user_id)
-            .single()
-            .execute()
-        )
+        with span("upstream", provider="supabase", operation="profile"):
+            response = (
+                supabase.from_("user_onboarding")
+                .select("*")
+                .eq("user_id", user_id)
+                .single()
+                .execute()
+            )
         if response.data:
-            user = response.data
             print("[STEP 1] User profile found:", response.data)
-            return UserProfile(
-                user_id=user_id,
-                age_range=user["age_range"],
-                gender=user["gender"],
-                home_location=user["home_location"],
-                travel_mode=user["preferred_travel_mode"],
-                preferred_pace=user["preferred_pace"],
-                interests=user["interests"],
-                diet_preferences=user["dietary_restrictions"],
-                food_preferences=user["food_preferences"] or "",
-                accessibility=user["accessibility"],
-                budget=user["budget_range"],
-            )
+            user_profile = profile_from_row(user_id, response.data)
+            profile_cache.set(user_id, user_profile)
+            return user_profile
         else:
             raise HTTPException(
                 status_code=404, detail="User onboarding profile not found."
@@ -247,6 +494,53 @@ def get_user_onboarding_profile(user_id: str):
         raise HTTPException(status_code=500, detail="Error fetching user profile.")
 
 
+# Called after onboarding data changes so the next request reads the new profile
+@app.post("/invalidate-profile")
+def invalidate_profile(request: InvalidateProfileRequest):
+    profile_cache.delete(request.user_id)
+    return {"invalidated": request.user_id}
+
+
+# Places ({"latitude": 48.8, ...}) and Ticketmaster venues ({"latitude": "48.8", ...})
+# locations -> {"lat", "lng"}
+def parse_coordinates(location: Optional[dict]):
+    try:
+        return {
+            "lat": float(location["latitude"]),
+            "lng": float(location["longitude"]),
+        }
+    except (KeyError, TypeError, ValueError):
+        return {"lat": None, "lng": None}
+
+
+# Copy lat/lng from the provider candidates onto generated items. The LLM output has
+# no ids, so items are matched by url, then title, then address.
+def attach_coordinates(items: list, candidates: list):
+    def key(value):
+        return " ".join((value or "").lower().split())
+
+    by_url, by_title, by_address = {}, {}, {}
+    for candidate in candidates:
+        if candidate.get("lat") is None:
+            continue
+        by_url.setdefault(candidate.get("url") or "", candidate)
+        by_title.setdefault(key(candidate.get("title")), candidate)
+        by_address.setdefault(key(candidate.get("address")), candidate)
+    by_url.pop("", None)
+    by_title.pop("", None)
+    by_address.pop("", None)
+
+    for item in items:
+        match = (
+            by_url.get(item.get("url") or "")
+            or by_title.get(key(item.get("title")))
+            or by_address.get(key(item.get("address")))
+        )
+        item["lat"] = match["lat"] if match else None
+        item["lng"] = match["lng"] if match else None
+    return items
+
+
 # Normalize google places api response into an ItineraryEvent schema
 def normalize_google_events(data):
     raw_google_events = data.get("places", [])
@@ -264,96 +558,226 @@ def normalize_google_events(data):
                 priceLevel=place.get("priceLevel"),
                 url=place.get("googleMapsUri"),
                 time_is_fixed=False,
+                **parse_coordinates(place.get("location")),
             )
         )
 
     return normalized_events
 
 
-def get_google_places_events(user_interests, destination: str):
-    # Call Google Places API to get places that match their interests + famous and highly rated places
-    google_places_url = "https://places.googleapis.com/v1/places:searchText"
-
-    google_events = {}
+def interest_query(interest: str, destination: str):
+    return f"{interest} in {destination}"
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-API-Key": os.getenv("GOOGLE_PLACES_API_KEY"),
-        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.googleMapsUri",
-    }
 
-    for interest in user_interests:
-        query = f"{interest} in {destination}"
-        payload = {"textQuery": query, "maxResultCount": 5}
+def famous_attraction_queries(destination: str):
+    return [
+        f"top attractions in {destination}",
+        f"famous landmarks in {destination}",
+        f"must see places in {destination}",
+    ]
 
-        response = requests.post(google_places_url, headers=headers, json=payload)
-        if response.ok:
-            data = response.json()
-            google_events[interest] = normalize_google_events(data)
-        else:
-            print("Google Places API Error:", response.text)
-            google_events[interest] = []
-            continue
 
-    return google_events
+def food_categories_for(food_preferences: str):
+    return ["restaurants", "cafes", "bars", "dessert shops"] + food_preferences.split(",")
 
 
-def get_famous_attractions(destination: str):
-    google_places_url = "https://places.googleapis.com/v1/places:searchText"
+def food_query(food_spot: str, destination: str):
+    return f"best {food_spot} near {destination}"
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-API-Key": os.getenv("GOOGLE_PLACES_API_KEY"),
-        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.googleMapsUri",
-    }
 
-    queries = [
-        f"top attractions in {destination}",
-        f"famous landmarks in {destination}",
-        f"must see places in {destination}",
-    ]
+# The Places searches a request for this destination would run, most shared first
+def prewarm_queries(destination: str, interests, food_preferences):
+    food_categories = food_categories_for(",".join(food_preferences))
+    return (
+        famous_attraction_queries(destination)
+        + [food_query(c, destination) for c in food_categories if c.strip()]
+        + [interest_query(i, destination) for i in interests]
+    )
 
-    attractions = []
 
-    for q in queries:
-        payload = {"textQuery": q, "maxResultCount": 5}
-        response = requests.post(google_places_url, headers=headers, json=payload)
+# Refreshes the Places cache for popular destinations in the background (prewarm.py)
+prewarmer = Prewarmer(prewarm_queries)
 
-        if response.ok:
-            data = response.json()
-            attractions.extend(normalize_google_events(data))
 
-    # Remove duplicates by ID
-    unique = {a.id: a for a in attractions}
+# Merge the famous-attraction search results, keeping each place once
+def dedupe_attractions(results):
+    unique = {a.id: a for events in results for a in events}
     return list(unique.values())
 
 
+def get_google_places_events(user_interests, destination: str):
+    # Call Google Places API to get places that match their interests + famous and highly rated places
+    google_events = {}
+
+    def search(interest):
+        data = search_places_text(interest_query(interest, destination), max_result_count=5)
+        if data is None:
+            return []
+        return normalize_google_events(data)
+
+    # One round trip for all interests instead of one per interest
+    results = fan_out(search, user_interests)
+    for interest, events in zip(user_interests, results):
+        google_events[interest] = events
+
+    return google_events
+
+
+def get_famous_attractions(destination: str):
+    def search(q):
+        data = search_places_text(q, max_result_count=5)
+        if data is None:
+            return []
+        return normalize_google_events(data)
+
+    return dedupe_attractions(fan_out(search, famous_attraction_queries(destination)))
+
+
+# Ticketmaster returns at most one page of events per request, sorted by date, so a
+# single request over a long trip only covers its first days. The trip is split into
+# day windows that are fetched concurrently and cached per (city, window).
+# A trip is fetched in windows of this many days (one request each), and the events
+# are then bucketed by day. Long trips get wider windows rather than more requests.
+TICKETMASTER_WINDOW_DAYS = int(os.getenv("TICKETMASTER_WINDOW_DAYS", "7"))
+TICKETMASTER_MAX_WINDOWS = int(os.getenv("TICKETMASTER_MAX_WINDOWS", "4"))
+TICKETMASTER_PAGE_SIZE = int(os.getenv("TICKETMASTER_PAGE_SIZE", "50"))
+# Pages fetched per window, only while the pages so far end before the window does
+TICKETMASTER_MAX_PAGES = int(os.getenv("TICKETMASTER_MAX_PAGES", "3"))
+# Events kept per trip day, so one busy day cannot crowd out the rest
+TICKETMASTER_EVENTS_PER_DAY = int(os.getenv("TICKETMASTER_EVENTS_PER_DAY", "10"))
+
+
 # Call ticketmaster api to get ticketed events
-def get_ticketmaster_events(destination: str, start_date: str, end_date: str):
-    ticketmaster_url = f"https://app.ticketmaster.com/discovery/v2/events.json"
-    ticketmaster_events = []
+def ticketmaster_params(destination: str, start_date: str, end_date: str, page: int = 0):
     params = {
-        "apikey": os.getenv("TICKETMASTER_API_KEY"),
         "locale": "*",
         "startDateTime": start_date.replace(".000Z", "Z"),
         "endDateTime": end_date.replace(".000Z", "Z"),
-        "size": 10,
+        "size": TICKETMASTER_PAGE_SIZE,
         "city": destination.strip(),
         "radius": 50,
         "unit": "miles",
         "sort": "date,asc",
         "countryCode": "US",
     }
+    if page:
+        params["page"] = page
+    return params
+
+
+# (start, end) of each window. Windows cover whole UTC days so that trips over
+# the same dates share cache entries. Unparseable dates give one window as before.
+def ticketmaster_windows(start_date: str, end_date: str):
+    try:
+        first = date.fromisoformat(start_date[:10])
+        last = date.fromisoformat(end_date[:10])
+    except (TypeError, ValueError):
+        return [(start_date, end_date)]
+    if last < first:
+        return [(start_date, end_date)]
+
+    days = (last - first).days + 1
+    window_days = max(
+        TICKETMASTER_WINDOW_DAYS, math.ceil(days / TICKETMASTER_MAX_WINDOWS)
+    )
+    windows = []
+    for offset in range(0, days, window_days):
+        window_start = first + timedelta(days=offset)
+        window_end = min(last, window_start + timedelta(days=window_days - 1))
+        windows.append((f"{window_start}T00:00:00Z", f"{window_end}T23:59:59Z"))
+    return windows
+
+
+def ticketmaster_page_events(data):
+    return data.get("_embedded", {}).get("events", []) if data else []
+
+
+def ticketmaster_event_day(event):
+    return event.get("dates", {}).get("start", {}).get("localDate")
+
+
+# Pages after the first one that are worth fetching for a window: only when the
+# first page is full and (results being sorted by date) ends before the window does
+def ticketmaster_extra_pages(first_page, window):
+    total_pages = (first_page or {}).get("page", {}).get("totalPages", 1)
+    events = ticketmaster_page_events(first_page)
+    if len(events) < TICKETMASTER_PAGE_SIZE:
+        return []
+    last_day = ticketmaster_event_day(events[-1])
+    if not last_day or last_day >= window[1][:10]:
+        return []
+    return list(range(1, min(total_pages, TICKETMASTER_MAX_PAGES)))
+
+
+# Events of every window in date order, without the ones seen in an earlier window,
+# and at most TICKETMASTER_EVENTS_PER_DAY per day
+def merge_ticketmaster_windows(window_events: list):
+    seen = set()
+    per_day = {}
+    events = []
+    for event in (e for window in window_events for e in window):
+        event_id = event.get("id")
+        day = ticketmaster_event_day(event)
+        if event_id in seen or per_day.get(day, 0) >= TICKETMASTER_EVENTS_PER_DAY:
+            continue
+        seen.add(event_id)
+        per_day[day] = per_day.get(day, 0) + 1
+        events.append(event)
+    return {"_embedded": {"events": events}}
+
+
+# A window page dropped because of the Ticketmaster rate limit leaves days without
+# events, so make that visible in the metrics, the request trace and the log
+def ticketmaster_page_skipped(window, page: int, error: RateLimitExceeded):
+    count_error("stage", "rate_limited", stage="ticketmaster_window")
+    trace = current_trace.get()
+    if trace is not None:
+        trace.append(
+            {
+                "family": "stage",
+                "stage": "ticketmaster_window",
+                "skipped": [*window, page],
+            }
+        )
+    print(f"[TICKETMASTER] Window {window[0]} - {window[1]} page {page} skipped: {error}")
 
-    response = requests.get(url=ticketmaster_url, params=params)
 
-    if response.ok:
-        data = response.json()
-        ticketmaster_events = normalize_ticketmaster_events(data)
-    else:
-        print("Ticketmaster API Error:", response.text)
+# One page of a window, or None if the rate limit skipped it
+def get_ticketmaster_page(destination: str, window, page: int = 0):
+    try:
+        return search_ticketmaster_events(
+            ticketmaster_params(destination, *window, page=page)
+        )
+    except RateLimitExceeded as e:
+        ticketmaster_page_skipped(window, page, e)
+        return None
+
+
+async def get_ticketmaster_page_async(destination: str, window, page: int = 0):
+    try:
+        return await search_ticketmaster_events_async(
+            ticketmaster_params(destination, *window, page=page)
+        )
+    except RateLimitExceeded as e:
+        ticketmaster_page_skipped(window, page, e)
+        return None
 
-    return ticketmaster_events
+
+def get_ticketmaster_window(destination: str, window):
+    first_page = get_ticketmaster_page(destination, window)
+    extra_pages = fan_out(
+        lambda page: get_ticketmaster_page(destination, window, page),
+        ticketmaster_extra_pages(first_page, window),
+    )
+    return [e for data in [first_page, *extra_pages] for e in ticketmaster_page_events(data)]
+
+
+def get_ticketmaster_events(destination: str, start_date: str, end_date: str):
+    window_events = fan_out(
+        lambda window: get_ticketmaster_window(destination, window),
+        ticketmaster_windows(start_date, end_date),
+    )
+    return normalize_ticketmaster_events(merge_ticketmaster_windows(window_events))
 
 
 def normalize_ticketmaster_events(data):
@@ -393,6 +817,7 @@ def normalize_ticketmaster_events(data):
                 priceLevel=None,
                 url=event.get("url"),
                 time_is_fixed=True,
+                **parse_coordinates(venue.get("location")),
             )
         )
 
@@ -413,40 +838,133 @@ def normalize_food_place(data):
                 rating=food_place.get("rating"),
                 priceLevel=food_place.get("priceLevel"),
                 url=food_place.get("googleMapsUri"),
+                **parse_coordinates(food_place.get("location")),
             )
         )
     return normalized_food_places
 
 
 # Call Google Places api for food options
+@span("stage", stage="food_candidates")
 def get_food_options(destination: str, food_preferences: str):
-    google_places_url = "https://places.googleapis.com/v1/places:searchText"
-
+    record_food_preferences(destination, food_preferences.split(","))
     google_restaurants = {}
+    food_categories = food_categories_for(food_preferences)
+
+    def search(food_spot):
+        data = search_places_text(food_query(food_spot, destination), max_result_count=5)
+        if data is None:
+            return []
+        return normalize_food_place(data)
+
+    results = fan_out(search, food_categories)
+    for food_spot, places in zip(food_categories, results):
+        google_restaurants[food_spot] = places
+    return google_restaurants
+
+
+# Fetch Google interest events, famous attractions and Ticketmaster events at the same time
+@span("stage", stage="event_candidates")
+def gather_event_candidates(
+    user_interests, destination: str, start_date: str, end_date: str
+):
+    record_destination(destination, user_interests)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        google_future = executor.submit(
+            propagate(get_google_places_events), user_interests, destination
+        )
+        famous_future = executor.submit(propagate(get_famous_attractions), destination)
+        tm_future = executor.submit(
+            propagate(get_ticketmaster_events), destination, start_date, end_date
+        )
+
+    return google_future.result(), famous_future.result(), tm_future.result()
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-API-Key": os.getenv("GOOGLE_PLACES_API_KEY"),
-        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.googleMapsUri",
+
+# Shape the candidate lists into the "events" block of the LLM payload
+def build_event_pool(google_places_events, famous_attractions, tm_events):
+    return {
+        "ticketmaster": [e.dict() for e in tm_events],
+        "google_place_events": {
+            k: [ev.dict() for ev in v] for k, v in google_places_events.items()
+        },
+        "famous_attractions": [a.dict() for a in famous_attractions],
     }
 
-    food_categories = ["restaurants", "cafes", "bars", "dessert shops"]
-    for pref in food_preferences.split(","):
-        food_categories.append(pref)
 
-    for food_spot in food_categories:
-        query = f"best {food_spot} near {destination}"
-        payload = {"textQuery": query, "maxResultCount": 5}
+# Every candidate in an "events" block, as one flat list
+def pool_candidates(events: dict):
+    return [
+        *events.get("ticketmaster", []),
+        *events.get("famous_attractions", []),
+        *(e for places in events.get("google_place_events", {}).values() for e in places),
+    ]
+
+
+def attach_itinerary_coordinates(itinerary: dict, events: dict):
+    items = [item for day in itinerary.get("itinerary", []) for item in day["items"]]
+    attach_coordinates(items, pool_candidates(events))
+    return itinerary
 
-        response = requests.post(google_places_url, headers=headers, json=payload)
-        if response.ok:
-            data = response.json()
-            google_restaurants[food_spot] = normalize_food_place(data)
-        else:
-            print("Google Places API Error:", response.text)
-            google_restaurants[food_spot] = []
-            continue
-    return google_restaurants
+
+# Post-process a generated itinerary before it is returned. Route ordering needs
+# coordinates, so they are attached for it and removed again unless requested.
+@span("stage", stage="finish_itinerary")
+def finish_itinerary(
+    itinerary: dict, events: dict, include_coordinates: bool, optimize_route: bool
+):
+    if not (include_coordinates or optimize_route):
+        return itinerary
+    attach_itinerary_coordinates(itinerary, events)
+    if optimize_route:
+        optimize_itinerary_routes(itinerary)
+    if not include_coordinates:
+        for day in itinerary.get("itinerary", []):
+            for item in day["items"]:
+                item.pop("lat", None)
+                item.pop("lng", None)
+    return itinerary
+
+
+# Candidate pools built by /generate-itinerary, kept so /regenerate-itinerary
+# can skip the provider fan-out while the trip stays the same
+candidate_pools = TTLCache(
+    "candidate_pools",
+    ttl_seconds=float(os.getenv("CANDIDATE_POOL_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("CANDIDATE_POOL_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("CANDIDATE_POOL_MAX_BYTES", str(64 * 1024 * 1024))),
+    sqlite_path=os.getenv("CANDIDATE_POOL_SQLITE_PATH") or None,
+)
+
+
+def save_candidate_pool(destination: str, start_date, end_date, events: dict):
+    pool_id = uuid.uuid4().hex
+    candidate_pools.set(
+        pool_id,
+        {
+            "destination": destination,
+            "start_date": start_date,
+            "end_date": end_date,
+            "events": events,
+        },
+    )
+    return pool_id
+
+
+# Returns the stored events, or None if the pool expired or belongs to another trip
+def load_candidate_pool(pool_id: Optional[str], destination: str, start_date, end_date):
+    if not pool_id:
+        return None
+    pool = candidate_pools.get(pool_id)
+    if pool is None:
+        return None
+    if (pool["destination"], pool["start_date"], pool["end_date"]) != (
+        destination,
+        start_date,
+        end_date,
+    ):
+        return None
+    return pool["events"]
 
 
 def build_user_prompt(payload_json: str):
@@ -463,6 +981,29 @@ Generate the itinerary strictly following all rules from the system prompt.
 """
 
 
+# Structured-output request built from a response model's JSON schema.
+# Cached because building the schema costs more CPU than the rest of a request.
+@lru_cache(maxsize=None)
+def llm_response_format(response_model):
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_model.__name__,
+            "schema": response_model.model_json_schema(),
+        },
+    }
+
+
+# Parse (repairing if needed) and validate an LLM reply instead of discarding it
+def parse_llm_output(raw_output: str, response_model):
+    try:
+        data = parse_llm_json(raw_output)
+        return response_model.model_validate(data).model_dump()
+    except (ValueError, ValidationError) as e:
+        print("Invalid LLM output:", e)
+        raise HTTPException(status_code=500, detail="Invalid JSON returned by LLM")
+
+
 # Define the system prompt ONCE
 LLM_PROMPT = """
 You are Itinera, an expert AI travel planner.
@@ -485,7 +1026,7 @@ PRIMARY RULES
 --------------------------------------------------
 ATTRACTION RULES
 --------------------------------------------------
-7. Across the entire trip, include a few iconic or famous attractions from the "famous_attractions" dataset in the input JSON.
+7. Across the entire trip, include a few iconic or famous attractions: the places whose "categories" include "famous_attractions" in the input JSON.
 
 --------------------------------------------------
 USER-INTEREST RULES
@@ -607,17 +1148,49 @@ OUTPUT RULES
 """
 
 
-@app.post("/generate-itinerary")
-def generate_itinerary(trip: TripDetails):
-    user_profile = get_user_onboarding_profile(trip.user_id)
-    user_interests = user_profile.interests.split(",")
+# "llm" lets the model schedule the whole itinerary, "local" uses scheduler.py
+ITINERARY_SCHEDULER = os.getenv("ITINERARY_SCHEDULER", "llm")
+
+# Used by the local scheduler: the days, times and items are already decided
+LLM_EXPLAIN_PROMPT = """
+You are Itinera, an expert AI travel planner.
+
+The itinerary in the input JSON has already been scheduled. Your ONLY job is to write the explanation for each item.
+
+--------------------------------------------------
+RULES
+--------------------------------------------------
+1. Write exactly ONE sentence per item, friendly, conversational and travel-agent–like.
+2. Reference interest alignment, iconic status, experience type or pacing rationale.
+3. Reflect the user's budget and the guest summary (children, infants, pets, groups) where relevant.
+4. Do NOT add, remove, rename or reschedule items.
+
+--------------------------------------------------
+OUTPUT FORMAT
+--------------------------------------------------
+Return ONLY JSON, keyed by the item "id" from the input:
+
+{
+  "explanations": {
+    "<item id>": "One sentence."
+  }
+}
+"""
 
-    google_places_events = get_google_places_events(user_interests, trip.destination)
-    famous_attractions = get_famous_attractions(trip.destination)
 
-    tm_events = get_ticketmaster_events(
-        trip.destination, trip.start_date, trip.end_date
+# Gather candidates for a new itinerary and store them as a candidate pool
+def gather_itinerary_pool(trip: TripDetails, user_profile: UserProfile):
+    user_interests = user_profile.interests.split(",")
+
+    google_places_events, famous_attractions, tm_events = gather_event_candidates(
+        user_interests, trip.destination, trip.start_date, trip.end_date
     )
+    return store_itinerary_pool(trip, google_places_events, famous_attractions, tm_events)
+
+
+def store_itinerary_pool(
+    trip: TripDetails, google_places_events, famous_attractions, tm_events
+):
     for ev in tm_events:
         pretty_print_event(ev)
 
@@ -626,144 +1199,335 @@ def generate_itinerary(trip: TripDetails):
         for ev in events:
             pretty_print_event(ev)
 
+    events = build_event_pool(google_places_events, famous_attractions, tm_events)
+    pool_id = save_candidate_pool(
+        trip.destination, trip.start_date, trip.end_date, events
+    )
+    return events, pool_id
+
+
+# Build the LLM messages for a new itinerary.
+# Also returns the id and events of the stored candidate pool.
+def build_itinerary_messages(trip: TripDetails, user_profile: UserProfile):
+    events, pool_id = gather_itinerary_pool(trip, user_profile)
+    return itinerary_messages(trip, user_profile, events), pool_id, events
+
+
+def itinerary_messages(trip: TripDetails, user_profile: UserProfile, events: dict):
     llm_payload = {
-        "trip_details": trip.dict(),
-        "user_profile": user_profile.dict(),
-        "events": {
-            "ticketmaster": [e.dict() for e in tm_events],
-            "google_place_events": {
-                k: [ev.dict() for ev in v] for k, v in google_places_events.items()
-            },
-            "famous_attractions": [a.dict() for a in famous_attractions],
-        },
+        "trip_details": llm_trip_details(trip),
+        "user_profile": user_profile.dict(exclude={"user_id"}),
+        "events": compact_event_pool(
+            prune_event_pool(events, user_profile, trip.start_date, trip.end_date)
+        ),
     }
 
-    payload_json = json.dumps(llm_payload, indent=2)
-
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        temperature=0.3,
-        messages=[
-            {"role": "system", "content": LLM_PROMPT},
-            {"role": "user", "content": build_user_prompt(payload_json)},
-        ],
+    payload_json = encode_payload(llm_payload)
+    payload_token_report(
+        "generate-itinerary",
+        {"trip_details": trip.dict(), "user_profile": user_profile.dict(), "events": events},
+        payload_json,
     )
 
-    raw_output = response.choices[0].message.content
+    messages = [
+        {"role": "system", "content": LLM_PROMPT},
+        {"role": "user", "content": build_user_prompt(payload_json)},
+    ]
+    return messages
+
+
+# Run the itinerary completion and parse its JSON
+# Identical requests are served from the LLM response cache unless no_cache is set.
+@span("stage", stage="itinerary_completion")
+def complete_itinerary(messages: list, temperature: float, no_cache: bool = False):
+    response_format = llm_response_format(ItineraryResponse)
+
+    def generate():
+        response = create_completion(
+            "itinerary",
+            model="gpt-4.1",
+            temperature=temperature,
+            response_format=response_format,
+            messages=messages,
+        )
+
+        raw_output = response.choices[0].message.content
+        return parse_llm_output(raw_output, ItineraryResponse)
+
+    cache_key = llm_cache_key("gpt-4.1", temperature, messages, response_format)
+    itinerary = llm_response_cache.get_or_compute(cache_key, generate, bypass=no_cache)
+    pretty_print_itinerary(itinerary)
+    return itinerary
+
+
+# Ask the LLM for one explanation sentence per scheduled item and fill them in
+@span("stage", stage="explanations")
+def add_explanations(itinerary: dict, trip: TripDetails, user_profile: UserProfile):
+    items = [item for day in itinerary["itinerary"] for item in day["items"]]
+    if not items:
+        return itinerary
+
+    payload = {
+        "trip_details": llm_trip_details(trip),
+        "user_profile": user_profile.dict(exclude={"user_id"}),
+        "items": [
+            {
+                "id": item["id"],
+                "date": day["date"],
+                "time": item["time"],
+                "title": item["title"],
+                "source": item["source"],
+            }
+            for day in itinerary["itinerary"]
+            for item in day["items"]
+        ],
+    }
 
+    explanations = {}
     try:
-        itinerary = json.loads(raw_output)
-        pretty_print_itinerary(itinerary)
-    except:
-        raise HTTPException(status_code=500, detail="Invalid JSON returned by LLM")
+        response = create_completion(
+            "explanations",
+            model="gpt-4.1",
+            temperature=0.4,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": LLM_EXPLAIN_PROMPT},
+                {"role": "user", "content": f"Here is the itinerary:\n{encode_payload(payload)}"},
+            ],
+        )
+        explanations = parse_llm_json(response.choices[0].message.content).get(
+            "explanations", {}
+        )
+    except Exception as e:
+        print("Explanation generation failed, using defaults:", e)
 
+    for item in items:
+        item["explanation"] = explanations.get(item["id"]) or default_explanation(item)
     return itinerary
 
 
-@app.post("/fetch-itinerary")
-def fetch_itinerary(request: FetchItineraryRequest):
-    """
-    Fetch a complete itinerary with all days and activities for a given user and itinerary ID.
-    Returns the itinerary in a structured format with days and items.
-    """
-    user_id = request.user_id
-    itinerary_id = request.itinerary_id
+# Schedule locally and use the LLM only for the explanation sentences
+def run_local_itinerary_pipeline(trip: TripDetails, user_profile: UserProfile):
+    events, pool_id = gather_itinerary_pool(trip, user_profile)
 
-    # Step 1: Verify the itinerary exists and belongs to the user
     try:
-        itinerary_response = (
+        with span("stage", stage="local_schedule"):
+            itinerary = schedule_itinerary(
+                events, user_profile, trip.start_date, trip.end_date
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid trip dates.")
+
+    add_explanations(itinerary, trip, user_profile)
+    finish_itinerary(
+        itinerary, events, trip.include_coordinates, trip.optimize_route
+    )
+    pretty_print_itinerary(itinerary)
+
+    itinerary["pool_id"] = pool_id
+    return itinerary
+
+
+def run_itinerary_pipeline(trip: TripDetails, user_profile: UserProfile):
+    if (trip.scheduler or ITINERARY_SCHEDULER) == "local":
+        return run_local_itinerary_pipeline(trip, user_profile)
+
+    messages, pool_id, events = build_itinerary_messages(trip, user_profile)
+    itinerary = complete_itinerary(messages, 0.3, no_cache=trip.no_cache)
+    finish_itinerary(
+        itinerary, events, trip.include_coordinates, trip.optimize_route
+    )
+
+    # Lets /regenerate-itinerary reuse this candidate pool
+    itinerary["pool_id"] = pool_id
+    return itinerary
+
+
+def generate_itinerary_sync(trip: TripDetails):
+    user_profile = get_user_onboarding_profile(trip.user_id)
+    return run_itinerary_pipeline(trip, user_profile)
+
+
+# Columns /fetch-itinerary needs. Days and their activities are embedded, so the whole
+# itinerary comes back from one PostgREST request, already ordered.
+ITINERARY_FETCH_SELECT = (
+    "id, itinerary_days(id, day_number, date, activities(id, name, location_name, "
+    "category, location_address, booking_url, description, start_time))"
+)
+
+
+# The itinerary row with its days (by day_number) and each day's activities (by start_time)
+def fetch_itinerary_rows(user_id: str, itinerary_id: str):
+    with span("upstream", provider="supabase", operation="fetch_itinerary"):
+        response = (
             supabase.from_("itineraries")
-            .select("*")
+            .select(ITINERARY_FETCH_SELECT)
             .eq("id", itinerary_id)
             .eq("user_id", user_id)
+            .order("day_number", foreign_table="itinerary_days")
+            .order("start_time", foreign_table="itinerary_days.activities")
             .single()
             .execute()
         )
-        if not itinerary_response.data:
-            raise HTTPException(
-                status_code=404,
-                detail="Itinerary not found or does not belong to this user.",
-            )
-    except Exception as e:
-        print(f"Error fetching itinerary: {e}")
-        raise HTTPException(
-            status_code=404,
-            detail="Itinerary not found or does not belong to this user.",
-        )
+    return response.data
+
+
+# Ids of the itinerary's days and activities: a few bytes per activity, so checking
+# them costs far less than the full fetch
+ITINERARY_VERSION_SELECT = "id, itinerary_days(id, activities(id))"
+
 
-    # Step 2: Fetch all days for this itinerary
-    days_response = (
-        supabase.from_("itinerary_days")
-        .select("*")
-        .eq("itinerary_id", itinerary_id)
-        .order("day_number")
-        .execute()
+# Version of a saved itinerary: a hash of its day and activity ids. Saving an edit
+# deletes and re-inserts the activities, which gives them new ids, so the version
+# changes with every edit no matter which instance served it. The tables have no
+# updated_at column, so in-place updates of activity columns are not seen here.
+def itinerary_version(days: list):
+    ids = sorted(
+        (day["id"], sorted(str(a.get("id")) for a in day.get("activities") or []))
+        for day in days
     )
-    days = days_response.data or []
+    return hashlib.sha256(json.dumps(ids).encode("utf-8")).hexdigest()[:32]
+
+
+# Version of a saved itinerary, or None if it does not exist for this user
+def fetch_itinerary_version(user_id: str, itinerary_id: int):
+    with span("upstream", provider="supabase", operation="itinerary_version"):
+        response = (
+            supabase.from_("itineraries")
+            .select(ITINERARY_VERSION_SELECT)
+            .eq("id", itinerary_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+    if not response.data:
+        return None
+    return itinerary_version(response.data[0].get("itinerary_days") or [])
+
+
+# "2025-01-01T19:30:00+00:00" -> "7:30 PM"
+def format_activity_time(start_time: Optional[str]):
+    if not start_time:
+        return None
+    try:
+        dt = datetime.fromisoformat(start_time.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt.strftime("%I:%M %p").lstrip("0")
 
-    if not days:
-        return {"itinerary": []}
-
-    # Step 3: Fetch all activities for all days in one query
-    day_ids = [day["id"] for day in days]
-    activities_response = (
-        supabase.from_("activities")
-        .select("*")
-        .in_("day_id", day_ids)
-        .order("start_time")
-        .execute()
-    )
-    activities = activities_response.data or []
-
-    # Step 4: Group activities by day_id
-    activities_by_day = {}
-    for activity in activities:
-        day_id = activity["day_id"]
-        if day_id not in activities_by_day:
-            activities_by_day[day_id] = []
-        activities_by_day[day_id].append(activity)
-
-    # Step 5: Build the response structure
-    itinerary_result = []
-    for day in days:
-        day_activities = activities_by_day.get(day["id"], [])
-
-        items = []
-        for activity in day_activities:
-            # Format the time from start_time if available
-            time_str = None
-            if activity.get("start_time"):
-                try:
-                    dt = datetime.fromisoformat(
-                        activity["start_time"].replace("Z", "+00:00")
-                    )
-                    time_str = dt.strftime("%I:%M %p").lstrip("0")
-                except ValueError:
-                    time_str = None
-
-            items.append(
-                {
-                    "time": time_str,
-                    "title": activity.get("name")
-                    or activity.get("location_name")
-                    or "Untitled",
-                    "type": "event",
-                    "source": activity.get("category") or "Unknown",
-                    "address": activity.get("location_address") or "",
-                    "url": activity.get("booking_url") or "",
-                    "explanation": activity.get("description") or "",
-                }
-            )
 
-        itinerary_result.append(
+# Shape the nested days/activities rows into the /fetch-itinerary response
+def shape_itinerary(days: list):
+    return {
+        "itinerary": [
             {
                 "day_id": day.get("day_number") or day["id"],
                 "date": day.get("date"),
-                "items": items,
+                "items": [
+                    {
+                        "time": format_activity_time(activity.get("start_time")),
+                        "title": activity.get("name")
+                        or activity.get("location_name")
+                        or "Untitled",
+                        "type": "event",
+                        "source": activity.get("category") or "Unknown",
+                        "address": activity.get("location_address") or "",
+                        "url": activity.get("booking_url") or "",
+                        "explanation": activity.get("description") or "",
+                    }
+                    for activity in day.get("activities") or []
+                ],
             }
+            for day in days
+        ]
+    }
+
+
+# Serialized /fetch-itinerary responses with their ETag and itinerary version, so
+# repeat views skip the full Supabase read and JSON encoding. The cache is per
+# instance, so an entry is only served while fetch_itinerary_version still matches.
+# In-place updates of activity columns do not change the version: anything that
+# updates rows without re-inserting them must call /invalidate-itinerary (and is
+# only seen by the instance that receives it until the TTL runs out).
+fetched_itineraries = TTLCache(
+    "fetched_itineraries",
+    ttl_seconds=float(os.getenv("FETCH_ITINERARY_CACHE_TTL_SECONDS", "300")),
+    max_entries=int(os.getenv("FETCH_ITINERARY_CACHE_MAX_ENTRIES", "2000")),
+)
+
+
+def fetched_itinerary_key(user_id: str, itinerary_id: int):
+    return f"{user_id}:{itinerary_id}"
+
+
+# Strong ETag from the serialized body
+def content_etag(body: str):
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@app.post("/fetch-itinerary")
+def fetch_itinerary(
+    request: FetchItineraryRequest, if_none_match: Optional[str] = Header(None)
+):
+    """
+    Fetch a complete itinerary with all days and activities for a given user and itinerary ID.
+    Returns the itinerary in a structured format with days and items.
+    Responses carry an ETag; send it back as If-None-Match to get a 304 when unchanged.
+    """
+    cache_key = fetched_itinerary_key(request.user_id, request.itinerary_id)
+    try:
+        # A cached copy costs one small version read; a miss goes straight to the full read
+        cached = fetched_itineraries.get(cache_key)
+        if cached is not None and cached["version"] != fetch_itinerary_version(
+            request.user_id, request.itinerary_id
+        ):
+            cached = None
+
+        if cached is None:
+            # One round trip: the itinerary (checked against the user) with days and activities
+            itinerary = fetch_itinerary_rows(request.user_id, request.itinerary_id)
+            if not itinerary:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Itinerary not found or does not belong to this user.",
+                )
+            days = itinerary.get("itinerary_days") or []
+            body = json.dumps(shape_itinerary(days))
+            cached = {
+                "etag": content_etag(body),
+                "body": body,
+                "version": itinerary_version(days),
+            }
+            fetched_itineraries.set(cache_key, cached)
+    except Exception as e:
+        print(f"Error fetching itinerary: {e}")
+        raise HTTPException(
+            status_code=404,
+            detail="Itinerary not found or does not belong to this user.",
         )
 
-    return {"itinerary": itinerary_result}
+    headers = {"ETag": cached["etag"], "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, cached["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=cached["body"], media_type="application/json", headers=headers
+    )
+
+
+# Called after a saved itinerary is edited. Re-inserted activities are caught by the
+# version check anyway; in-place updates are only seen through this.
+@app.post("/invalidate-itinerary")
+def invalidate_itinerary(request: InvalidateItineraryRequest):
+    fetched_itineraries.delete(
+        fetched_itinerary_key(request.user_id, request.itinerary_id)
+    )
+    return {"invalidated": request.itinerary_id}
 
 
 LLM_PROMPT_FOOD = """
@@ -825,43 +1589,117 @@ OUTPUT RULES
 """
 
 
-@app.post("/generate-food")
-def generate_food(trip: TripDetails):
-    user_profile = get_user_onboarding_profile(trip.user_id)
+# Gather food candidates and build the LLM messages for food recommendations.
+# Also returns the candidates, grouped by category.
+def build_food_messages(trip: TripDetails, user_profile: UserProfile):
     restaurants = get_food_options(trip.destination, user_profile.food_preferences)
+    return food_messages(trip, user_profile, restaurants)
 
+
+# Food candidates by category -> (LLM messages, candidates as dicts)
+def food_messages(trip: TripDetails, user_profile: UserProfile, restaurants: dict):
     for category, places in restaurants.items():
         print(f"\n=== CATEGORY: {category} ===\n")
         for place in places:
             pretty_print_food_place(place)
 
+    food_experiences = {
+        k: [place.dict() for place in v] for k, v in restaurants.items()
+    }
     payload = {
-        "trip_details": trip.dict(),
-        "user_profile": user_profile.dict(),
-        "food_experiences": {
-            k: [place.dict() for place in v] for k, v in restaurants.items()
-        },
+        "trip_details": llm_trip_details(trip),
+        "user_profile": user_profile.dict(exclude={"user_id"}),
+        "food_experiences": compact_food_pool(
+            prune_food_pool(
+                food_experiences, user_profile, trip.start_date, trip.end_date
+            )
+        ),
     }
 
-    payload_json = json.dumps(payload, indent=2)
+    payload_json = encode_payload(payload)
+    payload_token_report(
+        "generate-food",
+        {
+            "trip_details": trip.dict(),
+            "user_profile": user_profile.dict(),
+            "food_experiences": food_experiences,
+        },
+        payload_json,
+    )
 
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        temperature=0.4,
-        messages=[
-            {"role": "system", "content": LLM_PROMPT_FOOD},
-            {"role": "user", "content": f"Here is the food data:\n{payload_json}"},
-        ],
+    messages = [
+        {"role": "system", "content": LLM_PROMPT_FOOD},
+        {"role": "user", "content": f"Here is the food data:\n{payload_json}"},
+    ]
+    return messages, food_experiences
+
+
+# Run the food completion and parse its JSON
+# Identical requests are served from the LLM response cache unless no_cache is set.
+@span("stage", stage="food_completion")
+def complete_food(messages: list, no_cache: bool = False):
+    response_format = llm_response_format(FoodResponse)
+
+    def generate():
+        response = create_completion(
+            "food",
+            model="gpt-4.1",
+            temperature=0.4,
+            response_format=response_format,
+            messages=messages,
+        )
+
+        raw_output = response.choices[0].message.content
+        return parse_llm_output(raw_output, FoodResponse)
+
+    cache_key = llm_cache_key("gpt-4.1", 0.4, messages, response_format)
+    food_json = llm_response_cache.get_or_compute(cache_key, generate, bypass=no_cache)
+    pretty_print_food_recommendations(food_json)
+    return food_json
+
+
+def attach_food_coordinates(food_json: dict, food_experiences: dict):
+    attach_coordinates(
+        food_json.get("food_recommendations", []),
+        [place for places in food_experiences.values() for place in places],
     )
+    return food_json
 
-    raw_output = response.choices[0].message.content
 
-    try:
-        food_json = json.loads(raw_output)
-        pretty_print_food_recommendations(food_json)
-        return food_json
-    except:
-        raise HTTPException(status_code=500, detail="Invalid JSON returned by LLM")
+def run_food_pipeline(trip: TripDetails, user_profile: UserProfile):
+    messages, food_experiences = build_food_messages(trip, user_profile)
+    food_json = complete_food(messages, no_cache=trip.no_cache)
+    if trip.include_coordinates:
+        attach_food_coordinates(food_json, food_experiences)
+    return food_json
+
+
+def generate_food_sync(trip: TripDetails):
+    user_profile = get_user_onboarding_profile(trip.user_id)
+    return run_food_pipeline(trip, user_profile)
+
+
+# Itinerary and food recommendations in one request. The profile is read once and
+# both pipelines (candidate fetches + LLM completion) run at the same time, so the
+# total time is the slower of the two instead of their sum.
+def generate_trip_sync(trip: TripDetails):
+    user_profile = get_user_onboarding_profile(trip.user_id)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        itinerary_future = executor.submit(
+            propagate(run_itinerary_pipeline), trip, user_profile
+        )
+        food_future = executor.submit(propagate(run_food_pipeline), trip, user_profile)
+
+    return trip_response(itinerary_future.result(), food_future.result())
+
+
+def trip_response(itinerary: dict, food_json: dict):
+    return {
+        "itinerary": itinerary.get("itinerary", []),
+        "pool_id": itinerary.get("pool_id"),
+        "food_recommendations": food_json.get("food_recommendations", []),
+    }
 
 
 LLM_REGENERATE_PROMPT = """
@@ -881,7 +1719,7 @@ RULES FOR REGENERATION
    - previous itinerary
    - Ticketmaster
    - Google Places (events only, NOT restaurants)
-   - Famous attractions dataset
+   - Famous attractions (Google Places tagged "famous_attractions")
 7. You MUST NOT invent new places.
 8. Explanations must remain one friendly sentence.
 
@@ -914,17 +1752,30 @@ DO NOT return markdown or commentary.
 """
 
 
-@app.post("/regenerate-itinerary")
-def regenerate_itinerary(req: RegenerateRequest):
+# Load the candidate pool and build the LLM messages for a regeneration.
+# Also returns the id and events of the candidate pool that was used.
+def build_regeneration_messages(req: RegenerateRequest):
     # STEP 1 — Get the user's onboarding profile
     user_profile = get_user_onboarding_profile(req.user_id)
     user_interests = user_profile.interests.split(",")
 
-    # STEP 2 — Load event datasets again
-    google_places_events = get_google_places_events(user_interests, req.destination)
-    famous_attractions = get_famous_attractions(req.destination)
-    tm_events = get_ticketmaster_events(req.destination, req.start_date, req.end_date)
+    # STEP 2 — Reuse the candidate pool from /generate-itinerary, or load event datasets again
+    pool_id = req.pool_id
+    events = load_candidate_pool(pool_id, req.destination, req.start_date, req.end_date)
+    if events is None:
+        print(f"[STEP 2] Candidate pool {pool_id} missing or expired, fetching again")
+        google_places_events, famous_attractions, tm_events = gather_event_candidates(
+            user_interests, req.destination, req.start_date, req.end_date
+        )
+        events = build_event_pool(google_places_events, famous_attractions, tm_events)
+        pool_id = save_candidate_pool(
+            req.destination, req.start_date, req.end_date, events
+        )
+
+    return regeneration_messages(req, user_profile, events), pool_id, events
 
+
+def regeneration_messages(req: RegenerateRequest, user_profile: UserProfile, events: dict):
     # STEP 3 — Prepare regeneration payload for the LLM
     payload = {
         "trip_details": {
@@ -933,40 +1784,472 @@ def regenerate_itinerary(req: RegenerateRequest):
             "end_date": req.end_date,
             "num_guests": "",
         },
-        "user_profile": user_profile.dict(),
+        "user_profile": user_profile.dict(exclude={"user_id"}),
         "chat_messages": [msg.dict() for msg in req.chat_messages],
         "approvals": [a.dict() for a in req.approvals],
         "previous_itinerary": req.previous_itinerary,
-        "events": {
-            "ticketmaster": [e.dict() for e in tm_events],
-            "google_place_events": {
-                k: [ev.dict() for ev in v] for k, v in google_places_events.items()
-            },
-            "famous_attractions": [fa.dict() for fa in famous_attractions],
-        },
+        "events": compact_event_pool(
+            prune_event_pool(events, user_profile, req.start_date, req.end_date)
+        ),
     }
 
-    payload_json = json.dumps(payload, indent=2)
+    payload_json = encode_payload(payload)
+    payload_token_report(
+        "regenerate-itinerary",
+        {**payload, "user_profile": user_profile.dict(), "events": events},
+        payload_json,
+    )
 
-    # STEP 4 — LLM call
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        temperature=0.4,
-        messages=[
-            {"role": "system", "content": LLM_REGENERATE_PROMPT},
-            {"role": "user", "content": f"Here is the itinerary data:\n{payload_json}"},
-        ],
+    messages = [
+        {"role": "system", "content": LLM_REGENERATE_PROMPT},
+        {"role": "user", "content": f"Here is the itinerary data:\n{payload_json}"},
+    ]
+    return messages
+
+
+def regenerate_itinerary_sync(req: RegenerateRequest):
+    messages, pool_id, events = build_regeneration_messages(req)
+
+    # STEP 4 — LLM call, STEP 5 — Parse and return itinerary
+    itinerary = complete_itinerary(messages, 0.4, no_cache=req.no_cache)
+    finish_itinerary(itinerary, events, req.include_coordinates, req.optimize_route)
+
+    itinerary["pool_id"] = pool_id
+    return itinerary
+
+
+# Async generation mode. With GENERATION_MODE=async the generation endpoints run on
+# the event loop with AsyncOpenAI, httpx.AsyncClient and the async Supabase client,
+# so the number of in-flight generations is bound by the provider connection pools
+# instead of the threadpool. The default "sync" mode runs the *_sync functions above
+# on the threadpool, as before.
+GENERATION_MODE = os.getenv("GENERATION_MODE", "sync")
+
+# Generations in flight at once in async mode. Further requests wait for a slot
+# instead of queueing provider calls until the connection pools time out (in sync
+# mode the threadpool size is the same kind of limit).
+ASYNC_MAX_GENERATIONS = int(os.getenv("ASYNC_MAX_GENERATIONS", "64"))
+generation_slots = asyncio.Semaphore(ASYNC_MAX_GENERATIONS)
+
+async_supabase: Optional[AsyncClient] = None
+
+
+async def get_async_supabase():
+    global async_supabase
+    if async_supabase is None:
+        async_supabase = await acreate_client(
+            os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_ANON_KEY")
+        )
+    return async_supabase
+
+
+async def get_user_onboarding_profile_async(user_id: str):
+    with span("stage", stage="profile"):
+        cached_profile = profile_cache.get(user_id)
+        if cached_profile is not None:
+            return cached_profile
+
+        print(f"[STEP 1] Fetching user profile for user_id={user_id}")
+        try:
+            async_client = await get_async_supabase()
+            with span("upstream", provider="supabase", operation="profile"):
+                response = (
+                    await async_client.from_("user_onboarding")
+                    .select("*")
+                    .eq("user_id", user_id)
+                    .single()
+                    .execute()
+                )
+            if not response.data:
+                raise HTTPException(
+                    status_code=404, detail="User onboarding profile not found."
+                )
+            user_profile = profile_from_row(user_id, response.data)
+            profile_cache.set(user_id, user_profile)
+            return user_profile
+        except Exception as e:
+            print("Supabase Error:", e)
+            raise HTTPException(status_code=500, detail="Error fetching user profile.")
+
+
+# Run Places text searches concurrently and normalize each result
+async def search_places_async(queries: list, normalize):
+    results = await asyncio.gather(
+        *(search_places_text_async(q, max_result_count=5) for q in queries)
+    )
+    return [normalize(data) if data is not None else [] for data in results]
+
+
+async def get_ticketmaster_window_async(destination: str, window):
+    first_page = await get_ticketmaster_page_async(destination, window)
+    extra_pages = await asyncio.gather(
+        *(
+            get_ticketmaster_page_async(destination, window, page)
+            for page in ticketmaster_extra_pages(first_page, window)
+        )
     )
+    return [e for data in [first_page, *extra_pages] for e in ticketmaster_page_events(data)]
 
-    raw_output = response.choices[0].message.content
 
-    # STEP 5 — Parse and return itinerary
+async def get_ticketmaster_events_async(destination: str, start_date: str, end_date: str):
+    window_events = await asyncio.gather(
+        *(
+            get_ticketmaster_window_async(destination, window)
+            for window in ticketmaster_windows(start_date, end_date)
+        )
+    )
+    return normalize_ticketmaster_events(merge_ticketmaster_windows(window_events))
+
+
+async def gather_event_candidates_async(
+    user_interests, destination: str, start_date: str, end_date: str
+):
+    record_destination(destination, user_interests)
+    with span("stage", stage="event_candidates"):
+        interest_results, famous_results, tm_events = await asyncio.gather(
+            search_places_async(
+                [interest_query(i, destination) for i in user_interests],
+                normalize_google_events,
+            ),
+            search_places_async(
+                famous_attraction_queries(destination), normalize_google_events
+            ),
+            get_ticketmaster_events_async(destination, start_date, end_date),
+        )
+    return (
+        dict(zip(user_interests, interest_results)),
+        dedupe_attractions(famous_results),
+        tm_events,
+    )
+
+
+async def get_food_options_async(destination: str, food_preferences: str):
+    record_food_preferences(destination, food_preferences.split(","))
+    food_categories = food_categories_for(food_preferences)
+    with span("stage", stage="food_candidates"):
+        results = await search_places_async(
+            [food_query(c, destination) for c in food_categories], normalize_food_place
+        )
+    return dict(zip(food_categories, results))
+
+
+# Async counterpart of complete_itinerary / complete_food, sharing their LLM cache
+async def complete_json_async(
+    operation: str, messages: list, temperature: float, response_model, no_cache: bool
+):
+    response_format = llm_response_format(response_model)
+
+    async def generate():
+        await openai_limiter.wait_async(operation)
+        try:
+            with span("upstream", provider="openai", operation=operation):
+                response = await async_openai_client.chat.completions.create(
+                    model="gpt-4.1",
+                    temperature=temperature,
+                    response_format=response_format,
+                    messages=messages,
+                )
+        except RateLimitError as e:
+            openai_limiter.throttled(e.response)
+            raise
+        return parse_llm_output(response.choices[0].message.content, response_model)
+
+    cache_key = llm_cache_key("gpt-4.1", temperature, messages, response_format)
+    with span("stage", stage=f"{operation}_completion"):
+        return await llm_response_cache.get_or_compute_async(
+            cache_key, generate, bypass=no_cache
+        )
+
+
+async def run_itinerary_pipeline_async(trip: TripDetails, user_profile: UserProfile):
+    if (trip.scheduler or ITINERARY_SCHEDULER) == "local":
+        # Mostly CPU work plus one explanation call, so it stays on the threadpool
+        return await run_in_threadpool(
+            propagate(run_local_itinerary_pipeline), trip, user_profile
+        )
+
+    google_places_events, famous_attractions, tm_events = (
+        await gather_event_candidates_async(
+            user_profile.interests.split(","),
+            trip.destination,
+            trip.start_date,
+            trip.end_date,
+        )
+    )
+    events, pool_id = store_itinerary_pool(
+        trip, google_places_events, famous_attractions, tm_events
+    )
+    messages = itinerary_messages(trip, user_profile, events)
+    itinerary = await complete_json_async(
+        "itinerary", messages, 0.3, ItineraryResponse, trip.no_cache
+    )
+    pretty_print_itinerary(itinerary)
+    finish_itinerary(
+        itinerary, events, trip.include_coordinates, trip.optimize_route
+    )
+    itinerary["pool_id"] = pool_id
+    return itinerary
+
+
+async def run_food_pipeline_async(trip: TripDetails, user_profile: UserProfile):
+    restaurants = await get_food_options_async(
+        trip.destination, user_profile.food_preferences
+    )
+    messages, food_experiences = food_messages(trip, user_profile, restaurants)
+    food_json = await complete_json_async(
+        "food", messages, 0.4, FoodResponse, trip.no_cache
+    )
+    pretty_print_food_recommendations(food_json)
+    if trip.include_coordinates:
+        attach_food_coordinates(food_json, food_experiences)
+    return food_json
+
+
+async def regenerate_itinerary_async(req: RegenerateRequest):
+    user_profile = await get_user_onboarding_profile_async(req.user_id)
+
+    pool_id = req.pool_id
+    events = load_candidate_pool(pool_id, req.destination, req.start_date, req.end_date)
+    if events is None:
+        google_places_events, famous_attractions, tm_events = (
+            await gather_event_candidates_async(
+                user_profile.interests.split(","),
+                req.destination,
+                req.start_date,
+                req.end_date,
+            )
+        )
+        events = build_event_pool(google_places_events, famous_attractions, tm_events)
+        pool_id = save_candidate_pool(
+            req.destination, req.start_date, req.end_date, events
+        )
+
+    messages = regeneration_messages(req, user_profile, events)
+    itinerary = await complete_json_async(
+        "itinerary", messages, 0.4, ItineraryResponse, req.no_cache
+    )
+    pretty_print_itinerary(itinerary)
+    finish_itinerary(itinerary, events, req.include_coordinates, req.optimize_route)
+    itinerary["pool_id"] = pool_id
+    return itinerary
+
+
+@app.post("/generate-itinerary")
+async def generate_itinerary(trip: TripDetails):
+    if GENERATION_MODE == "async":
+        async with generation_slots:
+            user_profile = await get_user_onboarding_profile_async(trip.user_id)
+            return await run_itinerary_pipeline_async(trip, user_profile)
+    return await run_in_threadpool(generate_itinerary_sync, trip)
+
+
+@app.post("/generate-food")
+async def generate_food(trip: TripDetails):
+    if GENERATION_MODE == "async":
+        async with generation_slots:
+            user_profile = await get_user_onboarding_profile_async(trip.user_id)
+            return await run_food_pipeline_async(trip, user_profile)
+    return await run_in_threadpool(generate_food_sync, trip)
+
+
+@app.post("/generate-trip")
+async def generate_trip(trip: TripDetails):
+    if GENERATION_MODE == "async":
+        async with generation_slots:
+            user_profile = await get_user_onboarding_profile_async(trip.user_id)
+            itinerary, food_json = await asyncio.gather(
+                run_itinerary_pipeline_async(trip, user_profile),
+                run_food_pipeline_async(trip, user_profile),
+            )
+            return trip_response(itinerary, food_json)
+    return await run_in_threadpool(generate_trip_sync, trip)
+
+
+@app.post("/regenerate-itinerary")
+async def regenerate_itinerary(req: RegenerateRequest):
+    if GENERATION_MODE == "async":
+        async with generation_slots:
+            return await regenerate_itinerary_async(req)
+    return await run_in_threadpool(regenerate_itinerary_sync, req)
+
+
+# Server-Sent Events streaming
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Stream the completion and emit every item and day as soon as its JSON object closes.
+# Event order: "start", then "item"/"day" as they complete, then "done" with the
+# full itinerary (or "error"). The "done" itinerary goes through finish_itinerary, so
+# it can be in a different order than the streamed items.
+def stream_itinerary(
+    messages: list,
+    temperature: float,
+    pool_id: str,
+    events: dict,
+    include_coordinates: bool = False,
+    optimize_route: bool = False,
+):
+    yield sse_event("start", {"pool_id": pool_id})
+
+    parser = ItineraryStreamParser()
+    raw_chunks = []
     try:
-        itinerary = json.loads(raw_output)
-        pretty_print_itinerary(itinerary)
-        return itinerary
-    except:
-        raise HTTPException(status_code=500, detail="Invalid JSON returned by LLM")
+        stream = create_completion(
+            "itinerary_stream",
+            model="gpt-4.1",
+            temperature=temperature,
+            response_format=llm_response_format(ItineraryResponse),
+            messages=messages,
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            raw_chunks.append(delta)
+            for event, data in parser.feed(delta):
+                yield sse_event(event, data)
+    except Exception as e:
+        print("OpenAI streaming error:", e)
+        yield sse_event("error", {"detail": "Itinerary generation failed"})
+        return
+
+    try:
+        itinerary = parse_llm_output("".join(raw_chunks), ItineraryResponse)
+    except HTTPException as e:
+        yield sse_event("error", {"detail": e.detail})
+        return
+
+    finish_itinerary(itinerary, events, include_coordinates, optimize_route)
+    pretty_print_itinerary(itinerary)
+    itinerary["pool_id"] = pool_id
+    yield sse_event("done", itinerary)
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.post("/generate-itinerary/stream")
+def generate_itinerary_stream(trip: TripDetails):
+    user_profile = get_user_onboarding_profile(trip.user_id)
+    messages, pool_id, events = build_itinerary_messages(trip, user_profile)
+    return StreamingResponse(
+        stream_itinerary(
+            messages,
+            0.3,
+            pool_id,
+            events,
+            trip.include_coordinates,
+            trip.optimize_route,
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.post("/regenerate-itinerary/stream")
+def regenerate_itinerary_stream(req: RegenerateRequest):
+    messages, pool_id, events = build_regeneration_messages(req)
+    return StreamingResponse(
+        stream_itinerary(
+            messages,
+            0.4,
+            pool_id,
+            events,
+            req.include_coordinates,
+            req.optimize_route,
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+# Job mode: the same generations, queued on a bounded worker pool (see jobs.py).
+# POST /jobs/<endpoint> answers 202 with a job id right away, or 503/429 with
+# Retry-After when the queue is full, instead of starting yet another generation.
+# Jobs live in this process, so clients must poll the instance that accepted them.
+def submit_job(kind: str, user_id: str, run):
+    try:
+        job = job_queue.submit(kind, user_id, run)
+    except JobRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    print(f"[JOBS] Queued {kind} job {job.id} for user_id={user_id}")
+    return JSONResponse(
+        job.to_dict(job_queue.position(job)),
+        status_code=202,
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+@app.post("/jobs/generate-itinerary", status_code=202)
+def enqueue_generate_itinerary(trip: TripDetails):
+    return submit_job(
+        "generate-itinerary", trip.user_id, lambda: generate_itinerary_sync(trip)
+    )
+
+
+@app.post("/jobs/generate-food", status_code=202)
+def enqueue_generate_food(trip: TripDetails):
+    return submit_job("generate-food", trip.user_id, lambda: generate_food_sync(trip))
+
+
+@app.post("/jobs/generate-trip", status_code=202)
+def enqueue_generate_trip(trip: TripDetails):
+    return submit_job("generate-trip", trip.user_id, lambda: generate_trip_sync(trip))
+
+
+@app.post("/jobs/regenerate-itinerary", status_code=202)
+def enqueue_regenerate_itinerary(req: RegenerateRequest):
+    return submit_job(
+        "regenerate-itinerary", req.user_id, lambda: regenerate_itinerary_sync(req)
+    )
+
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+
+# Poll a job: status and queue position, plus the result or error once finished
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = get_job_or_404(job_id)
+    return job.to_dict(job_queue.position(job))
+
+
+# Seconds between checks of a job's status while a subscriber waits
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "0.25"))
+
+
+# Subscribe to a job as Server-Sent Events: "status" whenever the status or queue
+# position changes, then "done" with the same body as GET /jobs/{job_id}.
+# Waiting happens on the event loop, so subscribers do not hold threads.
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = get_job_or_404(job_id)
+
+    async def events():
+        last = None
+        while not job.done.is_set():
+            current = (job.status, job_queue.position(job))
+            if current != last:
+                yield sse_event("status", {"status": current[0], "position": current[1]})
+                last = current
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+        yield sse_event("done", job.to_dict())
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
 
 
 # Geocode API: convert address to lat/lng
@@ -976,11 +2259,7 @@ def geocode(address: str):
     if not address:
         raise HTTPException(status_code=400, detail="Address is required")
 
-    from urllib.parse import urlencode
-
-    params = urlencode({"address": address, "key": os.getenv("GOOGLE_PLACES_API_KEY")})
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?{params}"
-    res = requests.get(url)
+    res = geocode_address(address)
 
     if res.status_code != 200:
         raise HTTPException(
@@ -990,3 +2269,264 @@ def geocode(address: str):
     if not data.get("results"):
         raise HTTPException(status_code=404, detail="Address could not be geocoded")
     return data
+
+
+# Max number of Geocoding calls in flight for one batch, and max batch size
+GEOCODE_MAX_CONCURRENCY = int(os.getenv("GEOCODE_MAX_CONCURRENCY", "8"))
+GEOCODE_BATCH_LIMIT = 200
+
+
+# Geocode many addresses at once: duplicates are resolved once, cached addresses
+# skip Google, and the rest run concurrently.
+# Returns {address: {"lat", "lng"}} with None for addresses that could not be geocoded.
+@span("stage", stage="geocode")
+def geocode_many(addresses):
+    addresses = list(dict.fromkeys(a for a in addresses if a and a.strip()))
+
+    # "1 Main St" and "1 main st " are the same lookup
+    normalized = {a: " ".join(a.lower().split()) for a in addresses}
+    to_resolve = {}
+    for address, key in normalized.items():
+        to_resolve.setdefault(key, address)
+
+    results = fan_out(
+        geocode_lat_lng, to_resolve.values(), max_workers=GEOCODE_MAX_CONCURRENCY
+    )
+    resolved = dict(zip(to_resolve.keys(), results))
+    return {address: resolved[key] for address, key in normalized.items()}
+
+
+@app.post("/geocode/batch")
+def geocode_batch(request: GeocodeBatchRequest):
+    if len({a for a in request.addresses if a and a.strip()}) > GEOCODE_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {GEOCODE_BATCH_LIMIT} addresses per request",
+        )
+    return geocode_many(request.addresses)
+
+
+def has_coordinates(place: dict):
+    return place.get("lat") is not None and place.get("lng") is not None
+
+
+# Rows in the shape CreateItinerary used to insert directly
+def activity_row(day_id, item: dict, coords: dict):
+    return {
+        "day_id": day_id,
+        "name": item.get("title"),
+        "category": None,
+        "location_name": None,
+        "location_address": item.get("address"),
+        "description": item.get("explanation"),
+        "cost": None,
+        "start_time": None,
+        "end_time": None,
+        "latitude": coords["lat"],
+        "longitude": coords["lng"],
+        "booking_url": item.get("url"),
+        "place_id": None,
+        "is_fixed": True,
+    }
+
+
+def food_option_row(user_id: str, itinerary_id, place: dict, coords: dict):
+    return {
+        "user_id": user_id,
+        "itinerary_id": itinerary_id,
+        "name": place.get("title"),
+        "address": place.get("address"),
+        "rating": place.get("rating"),
+        "price_level": place.get("priceLevel"),
+        "url": place.get("url"),
+        "explanation": place.get("explanation"),
+        # food_options stores coordinates as text
+        "latitude": None if coords["lat"] is None else str(coords["lat"]),
+        "longitude": None if coords["lng"] is None else str(coords["lng"]),
+    }
+
+
+# Subject ("sub") of a Supabase access token, read without verifying the signature:
+# only used to reject mismatched user ids early. PostgREST verifies the token itself.
+def token_subject(token: str):
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("sub")
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+# PostgREST client acting as the caller: their access token replaces the anon key,
+# so row-level security applies to every write. Shares the anon client's connection
+# pool. 401 without a bearer token, 403 if it belongs to someone other than user_id.
+def user_database(authorization: Optional[str], user_id: str):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    if token_subject(token.strip()) != user_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this user")
+    return SyncPostgrestClient(
+        str(supabase.postgrest.base_url),
+        headers={**supabase.postgrest.headers, "authorization": f"Bearer {token.strip()}"},
+        http_client=supabase.postgrest.session,
+    )
+
+
+# Failed write -> HTTPException. PGRST301-303: PostgREST rejected the JWT (malformed,
+# bad signature, expired); 42501: a row-level security policy refused the write.
+def save_error(error: Exception):
+    code = str(error.code or "") if isinstance(error, APIError) else ""
+    if code.startswith("PGRST30"):
+        return HTTPException(status_code=401, detail="Invalid or expired token")
+    if code == "42501":
+        return HTTPException(status_code=403, detail="Not allowed to save this itinerary")
+    return HTTPException(status_code=500, detail="Error saving itinerary")
+
+
+def insert_rows(db: SyncPostgrestClient, table: str, rows: list):
+    if not rows:
+        return []
+    with span("upstream", provider="supabase", operation=f"insert_{table}"):
+        return db.from_(table).insert(rows).execute().data or []
+
+
+# Best-effort cleanup of a partially saved itinerary (there is no transaction across
+# PostgREST requests). Children first, in case the foreign keys do not cascade. Runs
+# as the caller, so row-level security limits it to their own rows.
+def delete_saved_itinerary(db: SyncPostgrestClient, itinerary_id, day_ids: list):
+    try:
+        if day_ids:
+            db.from_("activities").delete().in_("day_id", day_ids).execute()
+        db.from_("food_options").delete().eq("itinerary_id", itinerary_id).execute()
+        db.from_("itinerary_days").delete().eq("itinerary_id", itinerary_id).execute()
+        db.from_("itineraries").delete().eq("id", itinerary_id).execute()
+    except Exception as e:
+        print(f"Cleanup of itinerary {itinerary_id} failed: {e}")
+
+
+@app.post("/save-itinerary")
+def save_itinerary(
+    request: SaveItineraryRequest, authorization: Optional[str] = Header(None)
+):
+    """
+    Save a generated itinerary and its food list in one request.
+    Requires the user's Supabase access token (Authorization: Bearer ...); every
+    write runs with it, so row-level security applies as it did for client-side saves.
+    Writes are batched per table: the itinerary row, then all days, then all
+    activities, with the food options inserted alongside the days. Items without
+    lat/lng are geocoded concurrently while the first inserts run.
+    Returns the new itinerary, day, activity and food option ids.
+    """
+    db = user_database(authorization, request.user_id)
+    started = time.perf_counter()
+    days = request.itinerary
+    food = request.food_recommendations
+    missing = [
+        place.get("address")
+        for place in [item for day in days for item in day.get("items", [])] + food
+        if not has_coordinates(place)
+    ]
+
+    def coordinates_for(place, geocoded):
+        if has_coordinates(place):
+            return {"lat": place["lat"], "lng": place["lng"]}
+        return geocoded.get(place.get("address")) or {"lat": None, "lng": None}
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        geocode_future = executor.submit(propagate(geocode_many), missing)
+
+        try:
+            itinerary_row = insert_rows(
+                db,
+                "itineraries",
+                [
+                    {
+                        "user_id": request.user_id,
+                        "title": f"{request.destination} Trip",
+                        "destination": request.destination,
+                        "start_date": request.start_date,
+                        "end_date": request.end_date,
+                        "num_guests": request.num_guests,
+                    }
+                ],
+            )[0]
+        except Exception as e:
+            print(f"Error saving itinerary: {e}")
+            raise save_error(e)
+
+        itinerary_id = itinerary_row["id"]
+        day_ids = []
+        try:
+            days_future = executor.submit(
+                propagate(insert_rows),
+                db,
+                "itinerary_days",
+                [
+                    {
+                        "itinerary_id": itinerary_id,
+                        "day_number": index + 1,
+                        "date": day.get("date"),
+                        "notes": "",
+                    }
+                    for index, day in enumerate(days)
+                ],
+            )
+
+            try:
+                geocoded = geocode_future.result()
+            except Exception as e:
+                # Missing coordinates should not fail the save; those rows get null lat/lng
+                print(f"Error geocoding itinerary addresses: {e!r}")
+                geocoded = {}
+            food_future = executor.submit(
+                propagate(insert_rows),
+                db,
+                "food_options",
+                [
+                    food_option_row(
+                        request.user_id,
+                        itinerary_id,
+                        place,
+                        coordinates_for(place, geocoded),
+                    )
+                    for place in food
+                ],
+            )
+
+            day_rows = days_future.result()
+            day_ids = [row["id"] for row in day_rows]
+            day_id_by_number = {row["day_number"]: row["id"] for row in day_rows}
+
+            activity_rows = insert_rows(
+                db,
+                "activities",
+                [
+                    activity_row(
+                        day_id_by_number.get(index + 1),
+                        item,
+                        coordinates_for(item, geocoded),
+                    )
+                    for index, day in enumerate(days)
+                    for item in day.get("items", [])
+                ],
+            )
+            food_rows = food_future.result()
+        except Exception as e:
+            print(f"Error saving itinerary {itinerary_id}: {e}")
+            # Wait for in-flight inserts before cleaning up after them
+            executor.shutdown(wait=True)
+            delete_saved_itinerary(db, itinerary_id, day_ids)
+            raise save_error(e)
+
+    print(
+        f"[SAVE] Itinerary {itinerary_id}: {len(day_ids)} days, "
+        f"{len(activity_rows)} activities, {len(food_rows)} food options, "
+        f"{len(missing)} geocoded in {time.perf_counter() - started:.2f}s"
+    )
+    return {
+        "itinerary_id": itinerary_id,
+        "day_ids": day_ids,
+        "activity_ids": [row["id"] for row in activity_rows],
+        "food_option_ids": [row["id"] for row in food_rows],
+    }
@@ -0,0 +1,230 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+import numpy as np
+
+
+# Histogram buckets in seconds, from cache-fast calls to slow LLM completions
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Quantiles are computed over the most recent samples of each series
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+
+# Print one structured [TRACE] line per request with its spans
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+
+# Metric families: what is timed and which labels identify a series
+FAMILIES = {
+    "request": ("HTTP requests handled by the API", ("endpoint", "method", "status")),
+    "upstream": ("Calls to Supabase, Google, Ticketmaster and OpenAI", ("provider", "operation")),
+    "stage": ("Pipeline stages inside a request", ("stage",)),
+}
+
+
+class Series:
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=METRICS_WINDOW)
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+
+class Registry:
+    """
+    Latency histograms (with quantiles over a recent window) and error counters,
+    rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.errors = {}
+
+    def observe(self, family: str, labels: dict, seconds: float):
+        key = (family, tuple(labels.get(name, "") for name in FAMILIES[family][1]))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.observe(seconds)
+
+    def count_error(self, family: str, labels: dict, reason: str):
+        key = (family, tuple(labels.get(name, "") for name in FAMILIES[family][1]), reason)
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def render(self, cache_stats: dict = None, job_stats: dict = None):
+        with self.lock:
+            series = {
+                key: (list(s.bucket_counts), s.count, s.total, list(s.recent))
+                for key, s in self.series.items()
+            }
+            errors = dict(self.errors)
+
+        lines = []
+        for family, (help_text, label_names) in FAMILIES.items():
+            name = f"itinera_{family}_duration_seconds"
+            lines += [f"# HELP {name} {help_text}.", f"# TYPE {name} histogram"]
+            for (fam, values), (buckets, count, total, _) in sorted(series.items()):
+                if fam != family:
+                    continue
+                labels = format_labels(label_names, values)
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+            name = f"itinera_{family}_latency_seconds"
+            lines += [
+                f"# HELP {name} {help_text}, quantiles over the last {METRICS_WINDOW} calls.",
+                f"# TYPE {name} summary",
+            ]
+            for (fam, values), (_, count, total, recent) in sorted(series.items()):
+                if fam != family:
+                    continue
+                labels = format_labels(label_names, values)
+                for q, value in zip(QUANTILES, np.quantile(recent, QUANTILES)):
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+            name = f"itinera_{family}_errors_total"
+            lines += [f"# HELP {name} Failed {family} calls by reason.", f"# TYPE {name} counter"]
+            for (fam, values, reason), count in sorted(errors.items()):
+                if fam != family:
+                    continue
+                labels = format_labels(label_names + ("reason",), values + (reason,))
+                lines.append(f"{name}{{{labels}}} {count}")
+
+        if cache_stats:
+            lines += cache_lines(cache_stats)
+        if job_stats:
+            lines += job_lines(job_stats)
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values) -> str:
+    return ",".join(f'{n}="{escape_label(v)}"' for n, v in zip(names, values))
+
+
+# TTLCache counters as Prometheus series
+def cache_lines(cache_stats: dict):
+    lines = []
+    for field, metric_type in (
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("disk_hits", "counter"),
+        ("evictions", "counter"),
+        ("entries", "gauge"),
+        ("bytes", "gauge"),
+    ):
+        suffix = "_total" if metric_type == "counter" else ""
+        name = f"itinera_cache_{field}{suffix}"
+        lines.append(f"# TYPE {name} {metric_type}")
+        for cache, stats in sorted(cache_stats.items()):
+            lines.append(f'{name}{{cache="{escape_label(cache)}"}} {stats[field]}')
+    return lines
+
+
+# Job queue depth and counters (jobs.py) as Prometheus series
+def job_lines(job_stats: dict):
+    lines = []
+    for field, metric_type in (
+        ("queued", "gauge"),
+        ("running", "gauge"),
+        ("workers", "gauge"),
+        ("completed", "counter"),
+        ("rejected", "counter"),
+    ):
+        suffix = "_total" if metric_type == "counter" else ""
+        name = f"itinera_jobs_{field}{suffix}"
+        lines += [f"# TYPE {name} {metric_type}", f"{name} {job_stats[field]}"]
+    return lines
+
+
+registry = Registry()
+
+# Spans recorded during the current request, for the [TRACE] log line
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (httpx.TimeoutException, TimeoutError)) or (
+        "Timeout" in type(error).__name__
+    )
+
+
+@contextmanager
+def span(family: str, **labels):
+    """
+    Time a block into the given family's histogram. Exceptions are counted as
+    "timeout" or "error" and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        registry.count_error(family, labels, "timeout" if is_timeout(e) else "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe(family, labels, elapsed)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append(
+                {"family": family, **labels, "ms": round(elapsed * 1000, 1)}
+            )
+
+
+def count_error(family: str, reason: str, **labels):
+    registry.count_error(family, labels, reason)
+
+
+# Wrap fn so that, run in a worker thread, it records spans into the caller's trace
+def propagate(fn):
+    trace = current_trace.get()
+
+    def run(*args, **kwargs):
+        token = current_trace.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_trace.reset(token)
+
+    return run
+
+
+def log_trace(endpoint: str, status: int, elapsed: float, spans: list):
+    if not TRACE_LOG:
+        return
+    print(
+        "[TRACE] "
+        + json.dumps(
+            {
+                "endpoint": endpoint,
+                "status": status,
+                "ms": round(elapsed * 1000, 1),
+                "spans": spans,
+            }
+        )
+    )
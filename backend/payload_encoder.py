@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import random
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Explains the fields the compact encoding leaves out, so the LLM can still fill them in
+EVENT_POOL_LEGEND = (
+    "google_places: source is Google and time_is_fixed is false; categories lists the "
+    "user interests each place matched, and 'famous_attractions' marks iconic places. "
+    "ticketmaster: source is Ticketmaster and time_is_fixed is true."
+)
+
+# Fraction of generations that log the verbose-vs-compact token comparison. Encoding
+# and tokenizing the verbose payload is pure overhead, so only a sample pays for it.
+PAYLOAD_REPORT_SAMPLE_RATE = float(os.getenv("PAYLOAD_REPORT_SAMPLE_RATE", "0.01"))
+
+# Fields implied by the section (or not needed by the LLM) that are not sent
+OMITTED_PLACE_FIELDS = ("source", "time_is_fixed", "startDate", "time", "lat", "lng")
+OMITTED_TICKETMASTER_FIELDS = ("source", "time_is_fixed", "lat", "lng")
+
+
+# Recursively drop keys whose value is None
+def strip_nulls(value):
+    if isinstance(value, dict):
+        return {k: strip_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [strip_nulls(v) for v in value]
+    return value
+
+
+# "PRICE_LEVEL_MODERATE" -> "MODERATE"
+def shorten_price_level(price_level):
+    if isinstance(price_level, str) and price_level.startswith("PRICE_LEVEL_"):
+        return price_level[len("PRICE_LEVEL_") :]
+    return price_level
+
+
+# Merge per-category place lists into one list with each place listed once.
+# Each place records the categories it was found under.
+def merge_categories(places_by_category: dict, extra: dict = None):
+    merged = {}
+    sources = list(places_by_category.items()) + list((extra or {}).items())
+    for category, places in sources:
+        for place in places:
+            entry = merged.get(place["id"])
+            if entry is None:
+                entry = {
+                    k: v for k, v in place.items() if k not in OMITTED_PLACE_FIELDS
+                }
+                entry["priceLevel"] = shorten_price_level(entry.get("priceLevel"))
+                entry["categories"] = []
+                merged[place["id"]] = entry
+            if category not in entry["categories"]:
+                entry["categories"].append(category)
+    return list(merged.values())
+
+
+# Compact form of the "events" block built by build_event_pool.
+# Coordinates are left out: they are attached to the LLM's items afterwards.
+def compact_event_pool(events: dict):
+    return {
+        "legend": EVENT_POOL_LEGEND,
+        "ticketmaster": [
+            {k: v for k, v in e.items() if k not in OMITTED_TICKETMASTER_FIELDS}
+            for e in events.get("ticketmaster", [])
+        ],
+        "google_places": merge_categories(
+            events.get("google_place_events", {}),
+            {"famous_attractions": events.get("famous_attractions", [])},
+        ),
+    }
+
+
+# Compact form of the per-category food candidates
+def compact_food_pool(food_experiences: dict):
+    return merge_categories(food_experiences)
+
+
+def encode_payload(payload) -> str:
+    return json.dumps(strip_nulls(payload), separators=(",", ":"), ensure_ascii=False)
+
+
+def count_tokens(text: str) -> int:
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    # Rough estimate when tiktoken is not installed
+    return math.ceil(len(text) / 4)
+
+
+# Compare the compact encoding with the old json.dumps(indent=2) form and log the
+# savings, for a PAYLOAD_REPORT_SAMPLE_RATE sample of calls (None for the rest)
+def payload_token_report(label: str, verbose_payload, encoded: str):
+    if random.random() >= PAYLOAD_REPORT_SAMPLE_RATE:
+        return None
+    verbose_tokens = count_tokens(json.dumps(verbose_payload, indent=2))
+    compact_tokens = count_tokens(encoded)
+    saved = 1 - compact_tokens / verbose_tokens if verbose_tokens else 0.0
+    report = {
+        "label": label,
+        "verbose_tokens": verbose_tokens,
+        "compact_tokens": compact_tokens,
+        "saved_ratio": round(saved, 3),
+        "estimated": tiktoken is None,
+    }
+    print(
+        f"[LLM PAYLOAD] {label}: {verbose_tokens} -> {compact_tokens} tokens "
+        f"({saved:.0%} smaller{', estimated' if tiktoken is None else ''})"
+    )
+    return report
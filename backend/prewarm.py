@@ -0,0 +1,257 @@
+"""
+Background pre-warming of the Places cache for popular destinations.
+
+Refreshes the famous-attraction, food and common-interest searches behind
+get_famous_attractions, get_food_options and get_google_places_events before
+they expire, so the first request of the day for a hot city starts warm.
+Destinations come from recent requests seen by this process and from
+PREWARM_DESTINATIONS.
+
+In the API it runs as a daemon thread when PREWARM_ENABLED=1. It can also run
+once from the command line; that only helps a running API when both share the
+Places cache's SQLite tier (PLACES_CACHE_SQLITE_PATH):
+
+    cd backend && python prewarm.py --destinations "Paris, New York" --qps 2
+"""
+
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+
+from providers import places_cache, places_cache_key, PLACES_FIELD_MASK, search_places_text
+from ratelimit import RateLimitExceeded, TokenBucket
+
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0") == "1"
+
+# Always warmed, in addition to the destinations of recent requests
+PREWARM_DESTINATIONS = [
+    d.strip() for d in os.getenv("PREWARM_DESTINATIONS", "").split(",") if d.strip()
+]
+
+# Seconds between refresh runs, and the delay before the first one
+PREWARM_INTERVAL_SECONDS = float(os.getenv("PREWARM_INTERVAL_SECONDS", "10800"))
+PREWARM_INITIAL_DELAY_SECONDS = float(os.getenv("PREWARM_INITIAL_DELAY_SECONDS", "60"))
+
+# Request-rate budget of the refresher. Its calls also go through the shared Places
+# budget, so user requests keep most of the quota.
+PREWARM_QPS = float(os.getenv("PREWARM_QPS", "1"))
+PREWARM_MAX_CALLS_PER_RUN = int(os.getenv("PREWARM_MAX_CALLS_PER_RUN", "600"))
+
+# How many recent destinations, interests and food preferences are warmed
+PREWARM_MAX_DESTINATIONS = int(os.getenv("PREWARM_MAX_DESTINATIONS", "30"))
+PREWARM_TOP_INTERESTS = int(os.getenv("PREWARM_TOP_INTERESTS", "8"))
+PREWARM_TOP_FOOD_PREFERENCES = int(os.getenv("PREWARM_TOP_FOOD_PREFERENCES", "4"))
+
+# Requests older than this no longer count as recent
+PREWARM_RECENT_WINDOW_SECONDS = float(os.getenv("PREWARM_RECENT_WINDOW_SECONDS", "86400"))
+
+# Distinct destinations / interests / food preferences remembered per kind; the
+# least requested are forgotten first
+PREWARM_MAX_TRACKED = int(os.getenv("PREWARM_MAX_TRACKED", "1000"))
+
+# Interests warmed before any have been seen, e.g. from the CLI: the onboarding suggestions
+DEFAULT_INTERESTS = [
+    "Museums",
+    "Historical Sites",
+    "Art Galleries",
+    "Local Markets",
+    "Nightlife",
+    "Shopping",
+    "Food Tours",
+    "Beaches",
+]
+
+
+class RecentRequests:
+    """Destinations, interests and food preferences seen in recent requests."""
+
+    def __init__(
+        self,
+        window_seconds: float = PREWARM_RECENT_WINDOW_SECONDS,
+        max_tracked: int = PREWARM_MAX_TRACKED,
+    ):
+        self.window_seconds = window_seconds
+        self.max_tracked = max_tracked
+        self.lock = threading.Lock()
+        # kind -> normalized value -> [count, last_seen, value as first written]
+        self.seen = {"destination": {}, "interest": {}, "food": {}}
+        self.pruned_at = time.time()
+
+    def record(self, kind: str, values):
+        now = time.time()
+        with self.lock:
+            entries = self.seen[kind]
+            for value in values:
+                value = " ".join((value or "").split())
+                if not value:
+                    continue
+                entry = entries.setdefault(value.lower(), [0, now, value])
+                entry[0] += 1
+                entry[1] = now
+            if now - self.pruned_at > 60:
+                for kind_entries in self.seen.values():
+                    self.prune(kind_entries, now)
+                self.pruned_at = now
+            if len(entries) > self.max_tracked:
+                self.prune(entries, now)
+                # Evict a tenth at a time so a full table is not re-sorted on every request
+                rarest = sorted(entries, key=lambda k: (entries[k][0], entries[k][1]))
+                for key in rarest[: len(entries) - self.max_tracked * 9 // 10]:
+                    del entries[key]
+
+    def top(self, kind: str, n: int):
+        with self.lock:
+            entries = self.seen[kind]
+            self.prune(entries, time.time())
+            counts = Counter({e[2]: e[0] for e in entries.values()})
+        return [value for value, _ in counts.most_common(n)]
+
+    # Forget values not requested within the window. Caller holds the lock.
+    def prune(self, entries: dict, now: float):
+        cutoff = now - self.window_seconds
+        for key in [k for k, e in entries.items() if e[1] < cutoff]:
+            del entries[key]
+
+
+recent_requests = RecentRequests()
+
+
+# Only tracked while the refresher runs, so nothing accumulates when it is off
+def record_destination(destination: str, interests=()):
+    if not PREWARM_ENABLED:
+        return
+    recent_requests.record("destination", [destination])
+    recent_requests.record("interest", interests)
+
+
+def record_food_preferences(destination: str, food_preferences=()):
+    if not PREWARM_ENABLED:
+        return
+    recent_requests.record("destination", [destination])
+    recent_requests.record("food", food_preferences)
+
+
+class Prewarmer:
+    """
+    Refreshes the Places searches of popular destinations under a QPS budget.
+
+    queries_for(destination, interests, food_preferences) returns the text searches
+    a request for that destination would run (main.prewarm_queries). Searches whose
+    cache entry outlives the next run are skipped.
+    """
+
+    def __init__(self, queries_for, recent: RecentRequests = recent_requests):
+        self.queries_for = queries_for
+        self.recent = recent
+        self.bucket = TokenBucket(PREWARM_QPS, 1)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_run = {}
+
+    def destinations(self):
+        destinations = list(PREWARM_DESTINATIONS)
+        known = {d.lower() for d in destinations}
+        for destination in self.recent.top("destination", PREWARM_MAX_DESTINATIONS):
+            if destination.lower() not in known:
+                destinations.append(destination)
+                known.add(destination.lower())
+        return destinations[:PREWARM_MAX_DESTINATIONS]
+
+    def needs_refresh(self, query: str):
+        key = places_cache_key(query, PLACES_FIELD_MASK, 5)
+        expires_in = places_cache.expires_in(key)
+        return expires_in is None or expires_in < PREWARM_INTERVAL_SECONDS
+
+    def run_once(self, destinations=None, max_calls: int = PREWARM_MAX_CALLS_PER_RUN):
+        started = time.perf_counter()
+        destinations = destinations or self.destinations()
+        interests = self.recent.top("interest", PREWARM_TOP_INTERESTS) or DEFAULT_INTERESTS
+        food_preferences = self.recent.top("food", PREWARM_TOP_FOOD_PREFERENCES)
+
+        calls = fresh = failed = 0
+        for destination in destinations:
+            for query in self.queries_for(destination, interests, food_preferences):
+                if self.stop_event.is_set() or calls >= max_calls:
+                    break
+                if not self.needs_refresh(query):
+                    fresh += 1
+                    continue
+                time.sleep(self.bucket.reserve(float("inf"))[1])
+                calls += 1
+                try:
+                    data = search_places_text(query, max_result_count=5, refresh=True)
+                except RateLimitExceeded:
+                    # User requests have the Places budget; try again next run
+                    data = None
+                if data is None:
+                    failed += 1
+
+        self.last_run = {
+            "destinations": len(destinations),
+            "calls": calls,
+            "fresh": fresh,
+            "failed": failed,
+            "seconds": round(time.perf_counter() - started, 1),
+        }
+        print(f"[PREWARM] {self.last_run}")
+        return self.last_run
+
+    def run_forever(self):
+        if self.stop_event.wait(PREWARM_INITIAL_DELAY_SECONDS):
+            return
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print("[PREWARM] Run failed:", e)
+            self.stop_event.wait(PREWARM_INTERVAL_SECONDS)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run_forever, name="prewarm", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the Places cache once")
+    parser.add_argument(
+        "--destinations",
+        default=",".join(PREWARM_DESTINATIONS),
+        help="comma-separated cities (default: PREWARM_DESTINATIONS)",
+    )
+    parser.add_argument("--interests", default=",".join(DEFAULT_INTERESTS))
+    parser.add_argument("--food-preferences", default="")
+    parser.add_argument("--qps", type=float, default=PREWARM_QPS)
+    parser.add_argument("--max-calls", type=int, default=PREWARM_MAX_CALLS_PER_RUN)
+    args = parser.parse_args()
+
+    destinations = [d.strip() for d in args.destinations.split(",") if d.strip()]
+    if not destinations:
+        parser.error("no destinations: pass --destinations or set PREWARM_DESTINATIONS")
+    if places_cache.db is None:
+        print(
+            "Warning: PLACES_CACHE_SQLITE_PATH is not set, so the warmed entries "
+            "only live in this process"
+        )
+
+    # main builds the same queries as the request path
+    from main import prewarm_queries
+
+    recent = RecentRequests()
+    recent.record("interest", args.interests.split(","))
+    recent.record("food", args.food_preferences.split(","))
+    prewarmer = Prewarmer(prewarm_queries, recent)
+    prewarmer.bucket = TokenBucket(args.qps, 1)
+    prewarmer.run_once(destinations, max_calls=args.max_calls)
+
+
+if __name__ == "__main__":
+    main()
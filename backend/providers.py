@@ -0,0 +1,310 @@
+import os
+import tempfile
+import httpx
+from typing import Optional
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+from cache import TTLCache
+from metrics import count_error
+from ratelimit import ProviderLimiter, RateLimitExceeded
+
+
+load_dotenv()
+
+# Upstream endpoints. The base URLs can be overridden, e.g. to point at the local
+# stand-ins in benchmarks/fake_upstreams.py
+GOOGLE_PLACES_BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://places.googleapis.com")
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+TICKETMASTER_BASE_URL = os.getenv("TICKETMASTER_BASE_URL", "https://app.ticketmaster.com")
+
+GOOGLE_PLACES_URL = f"{GOOGLE_PLACES_BASE_URL}/v1/places:searchText"
+GOOGLE_GEOCODING_URL = f"{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json"
+TICKETMASTER_URL = f"{TICKETMASTER_BASE_URL}/discovery/v2/events.json"
+
+# Fields requested from every Places text search
+PLACES_FIELD_MASK = "places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.googleMapsUri,places.location"
+
+
+# Build a long-lived HTTP/2 client whose connection pool is sized per provider.
+# Keeping the connections alive means only the first call pays for TCP + TLS.
+def make_http_client(
+    pool_size_env: str,
+    default_pool_size: int,
+    headers: Optional[dict] = None,
+    client_class=httpx.Client,
+):
+    pool_size = int(os.getenv(pool_size_env, str(default_pool_size)))
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=60,
+    )
+    return client_class(
+        http2=True,
+        limits=limits,
+        headers=headers,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+
+
+PLACES_HEADERS = {
+    "Content-Type": "application/json",
+    "X-Goog-API-Key": os.getenv("GOOGLE_PLACES_API_KEY", ""),
+    "X-Goog-FieldMask": PLACES_FIELD_MASK,
+}
+
+places_client = make_http_client("PLACES_POOL_SIZE", 16, headers=PLACES_HEADERS)
+geocoding_client = make_http_client("GEOCODING_POOL_SIZE", 8)
+ticketmaster_client = make_http_client("TICKETMASTER_POOL_SIZE", 8)
+
+# Async counterparts for the async generation mode (GENERATION_MODE=async in main.py).
+# The pool sizes then bound how many calls per provider are in flight.
+async_places_client = make_http_client(
+    "PLACES_POOL_SIZE", 16, headers=PLACES_HEADERS, client_class=httpx.AsyncClient
+)
+async_ticketmaster_client = make_http_client(
+    "TICKETMASTER_POOL_SIZE", 8, client_class=httpx.AsyncClient
+)
+
+# The OpenAI SDK accepts its own httpx client, so completions reuse one pool too
+openai_pool_size = int(os.getenv("OPENAI_POOL_SIZE", "16"))
+openai_client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    # None keeps the SDK default (api.openai.com)
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    http_client=httpx.Client(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=openai_pool_size,
+            max_keepalive_connections=openai_pool_size,
+        ),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    ),
+)
+async_openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=openai_pool_size,
+            max_keepalive_connections=openai_pool_size,
+        ),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    ),
+)
+
+
+# Per-provider QPS budgets shared by all requests in this process (with 3 App Engine
+# instances, each gets its own budget). Defaults follow the providers' documented
+# quotas: Places 600 QPM, Ticketmaster 5 QPS, Geocoding 50 QPS. OpenAI limits depend
+# on the account tier, so its budget is off unless OPENAI_QPS is set.
+places_limiter = ProviderLimiter.from_env("google_places", "PLACES", 10, 20)
+ticketmaster_limiter = ProviderLimiter.from_env("ticketmaster", "TICKETMASTER", 5, 5)
+geocoding_limiter = ProviderLimiter.from_env("google_geocoding", "GEOCODING", 50, 50)
+openai_limiter = ProviderLimiter.from_env("openai", "OPENAI", 0, 1)
+
+
+# Places text-search results for popular destinations barely change, so
+# identical searches are answered from memory (and optionally SQLite)
+places_cache = TTLCache(
+    "places",
+    ttl_seconds=float(os.getenv("PLACES_CACHE_TTL_SECONDS", "21600")),
+    max_entries=int(os.getenv("PLACES_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("PLACES_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    sqlite_path=os.getenv("PLACES_CACHE_SQLITE_PATH") or None,
+)
+
+
+# "Top  Attractions in Paris" and "top attractions in paris" share one entry
+def places_cache_key(text_query: str, field_mask: str, max_result_count: int):
+    normalized_query = " ".join(text_query.lower().split())
+    return f"{normalized_query}|{field_mask}|{max_result_count}"
+
+
+# Cache a successful Places response; log and count a failed one
+def handle_places_response(cache_key: str, response: httpx.Response):
+    if response.is_success:
+        data = response.json()
+        places_cache.set(cache_key, data)
+        return data
+    count_error(
+        "upstream",
+        f"http_{response.status_code}",
+        provider="google_places",
+        operation="search_text",
+    )
+    print("Google Places API Error:", response.text)
+    return None
+
+
+# Google Places text search. Returns the parsed response or None on an API error.
+# RateLimitExceeded propagates: a throttled search is not "no results", so the request
+# fails with 503 + Retry-After instead of silently returning a thinner pool.
+# refresh=True skips the cache lookup and replaces the entry (prewarm.py).
+def search_places_text(text_query: str, max_result_count: int = 5, refresh: bool = False):
+    cache_key = places_cache_key(text_query, PLACES_FIELD_MASK, max_result_count)
+    cached = None if refresh else places_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    payload = {"textQuery": text_query, "maxResultCount": max_result_count}
+    response = places_limiter.call(
+        "search_text", places_client.post, GOOGLE_PLACES_URL, json=payload
+    )
+    return handle_places_response(cache_key, response)
+
+
+async def search_places_text_async(text_query: str, max_result_count: int = 5):
+    cache_key = places_cache_key(text_query, PLACES_FIELD_MASK, max_result_count)
+    cached = places_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    payload = {"textQuery": text_query, "maxResultCount": max_result_count}
+    response = await places_limiter.call_async(
+        "search_text", async_places_client.post, GOOGLE_PLACES_URL, json=payload
+    )
+    return handle_places_response(cache_key, response)
+
+
+# Ticketmaster pages per (city, date window, page). Listings change during the day,
+# so entries are kept for an hour by default.
+ticketmaster_cache = TTLCache(
+    "ticketmaster",
+    ttl_seconds=float(os.getenv("TICKETMASTER_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("TICKETMASTER_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("TICKETMASTER_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    sqlite_path=os.getenv("TICKETMASTER_CACHE_SQLITE_PATH") or None,
+)
+
+
+def ticketmaster_cache_key(params: dict):
+    return "&".join(f"{k}={str(params[k]).strip().lower()}" for k in sorted(params))
+
+
+def ticketmaster_request_params(params: dict):
+    return {"apikey": os.getenv("TICKETMASTER_API_KEY", ""), **params}
+
+
+def handle_ticketmaster_response(cache_key: str, response: httpx.Response):
+    if response.is_success:
+        data = response.json()
+        ticketmaster_cache.set(cache_key, data)
+        return data
+    count_error(
+        "upstream",
+        f"http_{response.status_code}",
+        provider="ticketmaster",
+        operation="events",
+    )
+    print("Ticketmaster API Error:", response.text)
+    return None
+
+
+# Ticketmaster discovery search. Returns the parsed response or None on an API error.
+# Raises RateLimitExceeded when the budget is exhausted; callers decide what a
+# skipped window means (main.get_ticketmaster_page)
+def search_ticketmaster_events(params: dict):
+    cache_key = ticketmaster_cache_key(params)
+    cached = ticketmaster_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = ticketmaster_limiter.call(
+        "events",
+        ticketmaster_client.get,
+        TICKETMASTER_URL,
+        params=ticketmaster_request_params(params),
+    )
+    return handle_ticketmaster_response(cache_key, response)
+
+
+async def search_ticketmaster_events_async(params: dict):
+    cache_key = ticketmaster_cache_key(params)
+    cached = ticketmaster_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = await ticketmaster_limiter.call_async(
+        "events",
+        async_ticketmaster_client.get,
+        TICKETMASTER_URL,
+        params=ticketmaster_request_params(params),
+    )
+    return handle_ticketmaster_response(cache_key, response)
+
+
+# Google Geocoding lookup. Returns the raw response so callers can map status codes.
+def geocode_address(address: str):
+    params = {"address": address, "key": os.getenv("GOOGLE_PLACES_API_KEY", "")}
+    try:
+        response = geocoding_limiter.call(
+            "geocode", geocoding_client.get, GOOGLE_GEOCODING_URL, params=params
+        )
+    except RateLimitExceeded as e:
+        # Same shape as a throttled reply, so callers handle it like one
+        return httpx.Response(429, text=str(e))
+    if not response.is_success:
+        count_error(
+            "upstream",
+            f"http_{response.status_code}",
+            provider="google_geocoding",
+            operation="geocode",
+        )
+    return response
+
+
+# Address -> {lat, lng}. Coordinates of an address practically never change, so
+# entries live for a long time and are kept on disk across restarts
+geocode_cache = TTLCache(
+    "geocode",
+    ttl_seconds=float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+    max_entries=int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "20000")),
+    sqlite_path=os.getenv(
+        "GEOCODE_CACHE_SQLITE_PATH",
+        os.path.join(tempfile.gettempdir(), "itinera_geocode_cache.sqlite3"),
+    )
+    or None,
+)
+
+
+# Resolve an address to {"lat": ..., "lng": ...}, or None if it cannot be geocoded.
+# Connection errors and malformed replies also give None (and are not cached), so
+# one bad address never fails a batch.
+def geocode_lat_lng(address: str):
+    cache_key = " ".join(address.lower().split())
+    cached = geocode_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        response = geocode_address(address)
+        if not response.is_success:
+            print("Google Geocoding API Error:", response.text)
+            return None
+        results = response.json().get("results") or []
+        if not results:
+            return None
+        location = results[0]["geometry"]["location"]
+        coords = {"lat": location["lat"], "lng": location["lng"]}
+    except (httpx.HTTPError, ValueError, KeyError, TypeError, AttributeError) as e:
+        count_error(
+            "upstream", type(e).__name__, provider="google_geocoding", operation="geocode"
+        )
+        print("Google Geocoding API Error:", repr(e))
+        return None
+    geocode_cache.set(cache_key, coords)
+    return coords
+
+
+def close_clients():
+    for http_client in (places_client, geocoding_client, ticketmaster_client):
+        http_client.close()
+    openai_client.close()
+
+
+async def close_async_clients():
+    for http_client in (async_places_client, async_ticketmaster_client):
+        await http_client.aclose()
+    await async_openai_client.close()
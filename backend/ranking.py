@@ -0,0 +1,194 @@
+import os
+from datetime import date
+
+import numpy as np
+
+
+# Events per day the itinerary prompt asks for, by preferred_pace
+PACE_QUOTAS = {"relaxed": 2, "balanced": 3, "fast": 4}
+DEFAULT_DAILY_QUOTA = 3
+
+# The food prompt asks for 8-15 recommendations depending on trip length
+MIN_FOOD_RECOMMENDATIONS = 8
+MAX_FOOD_RECOMMENDATIONS = 15
+
+# How many candidates to keep per slot the LLM has to fill
+RANKING_OVERSAMPLE = float(os.getenv("RANKING_OVERSAMPLE", "2"))
+
+PRICE_LEVELS = {
+    "PRICE_LEVEL_FREE": 0,
+    "PRICE_LEVEL_INEXPENSIVE": 1,
+    "PRICE_LEVEL_MODERATE": 2,
+    "PRICE_LEVEL_EXPENSIVE": 3,
+    "PRICE_LEVEL_VERY_EXPENSIVE": 4,
+}
+
+# Keywords in the profile's budget string -> the price level that fits it best
+BUDGET_TARGETS = [
+    (("luxury", "premium", "high"), 3),
+    (("medium", "standard", "moderate", "mid"), 2),
+    (("low", "budget", "economy", "cheap"), 1),
+]
+
+# Feature weights: interest match, rating, price fit, fixed time, famous attraction
+EVENT_WEIGHTS = np.array([3.0, 1.5, 1.0, 2.0, 1.5])
+FOOD_WEIGHTS = np.array([2.0, 2.0, 1.5, 0.0, 0.0])
+
+NEUTRAL_RATING = 3.5
+NEUTRAL_PRICE_FIT = 0.75
+
+
+def trip_length_days(start_date, end_date, default: int = 3) -> int:
+    try:
+        start = date.fromisoformat(str(start_date)[:10])
+        end = date.fromisoformat(str(end_date)[:10])
+    except ValueError:
+        return default
+    return max(1, (end - start).days + 1)
+
+
+def daily_quota(preferred_pace: str) -> int:
+    return PACE_QUOTAS.get((preferred_pace or "").strip().lower(), DEFAULT_DAILY_QUOTA)
+
+
+def budget_target(budget: str):
+    budget = (budget or "").lower()
+    for keywords, level in BUDGET_TARGETS:
+        if any(k in budget for k in keywords):
+            return level
+    return None
+
+
+def split_terms(text: str):
+    return [t.strip().lower() for t in (text or "").split(",") if t.strip()]
+
+
+# Collect every candidate once, remembering which categories it was found under
+def collect_candidates(places_by_category: dict):
+    candidates = {}
+    for category, places in places_by_category.items():
+        for place in places:
+            entry = candidates.setdefault(place["id"], {"place": place, "categories": set()})
+            entry["categories"].add(category.strip().lower())
+    return list(candidates.values())
+
+
+# Score every candidate at once: one row of features per candidate, one weight per feature
+def score_candidates(candidates: list, interests: list, budget: str, weights):
+    n = len(candidates)
+    interests = set(interests)
+    target = budget_target(budget)
+
+    interest_match = np.zeros(n)
+    ratings = np.full(n, NEUTRAL_RATING)
+    price_levels = np.full(n, np.nan)
+    fixed_time = np.zeros(n)
+    famous = np.zeros(n)
+
+    for i, candidate in enumerate(candidates):
+        place = candidate["place"]
+        categories = candidate["categories"]
+        title = (place.get("title") or "").lower()
+        matched = len(categories & interests)
+        if any(interest in title for interest in interests):
+            matched += 1
+        interest_match[i] = matched
+        if place.get("rating") is not None:
+            ratings[i] = place["rating"]
+        level = PRICE_LEVELS.get(place.get("priceLevel"))
+        if level is not None:
+            price_levels[i] = level
+        fixed_time[i] = 1.0 if place.get("time_is_fixed") else 0.0
+        famous[i] = 1.0 if "famous_attractions" in categories else 0.0
+
+    if target is None:
+        price_fit = np.full(n, NEUTRAL_PRICE_FIT)
+    else:
+        price_fit = 1.0 - np.abs(price_levels - target) / 4.0
+        price_fit = np.where(np.isnan(price_fit), NEUTRAL_PRICE_FIT, price_fit)
+
+    features = np.column_stack(
+        [
+            np.minimum(interest_match, 2.0) / 2.0,
+            np.clip(ratings, 0.0, 5.0) / 5.0,
+            price_fit,
+            fixed_time,
+            famous,
+        ]
+    )
+    return features @ weights
+
+
+# Ids of the k best candidates; ties keep their original order
+def top_k_ids(candidates: list, scores, k: int):
+    if k >= len(candidates):
+        return {c["place"]["id"] for c in candidates}
+    order = np.argsort(-scores, kind="stable")[:k]
+    return {candidates[i]["place"]["id"] for i in order}
+
+
+# Every event candidate from the "events" block built by build_event_pool,
+# best first, as (candidate, score) pairs
+def rank_event_candidates(events: dict, user_profile):
+    by_category = {
+        "ticketmaster": events.get("ticketmaster", []),
+        "famous_attractions": events.get("famous_attractions", []),
+        **events.get("google_place_events", {}),
+    }
+    candidates = collect_candidates(by_category)
+    if not candidates:
+        return []
+    scores = score_candidates(
+        candidates, split_terms(user_profile.interests), user_profile.budget, EVENT_WEIGHTS
+    )
+    order = np.argsort(-scores, kind="stable")
+    return [(candidates[i], float(scores[i])) for i in order]
+
+
+# Keep only the best event candidates for the trip length x pace quota.
+# Takes and returns the "events" block built by build_event_pool.
+def prune_event_pool(events: dict, user_profile, start_date, end_date):
+    slots = trip_length_days(start_date, end_date) * daily_quota(
+        user_profile.preferred_pace
+    )
+    k = int(np.ceil(slots * RANKING_OVERSAMPLE))
+
+    ranked = rank_event_candidates(events, user_profile)
+    keep = {candidate["place"]["id"] for candidate, _ in ranked[:k]}
+
+    print(f"[RANKING] Kept {len(keep)} of {len(ranked)} event candidates")
+    return {
+        "ticketmaster": [e for e in events.get("ticketmaster", []) if e["id"] in keep],
+        "google_place_events": {
+            category: [e for e in places if e["id"] in keep]
+            for category, places in events.get("google_place_events", {}).items()
+        },
+        "famous_attractions": [
+            e for e in events.get("famous_attractions", []) if e["id"] in keep
+        ],
+    }
+
+
+# Keep only the best food candidates for the number of recommendations the LLM makes
+def prune_food_pool(food_experiences: dict, user_profile, start_date, end_date):
+    recommendations = int(
+        np.clip(
+            trip_length_days(start_date, end_date) * 3,
+            MIN_FOOD_RECOMMENDATIONS,
+            MAX_FOOD_RECOMMENDATIONS,
+        )
+    )
+    k = int(np.ceil(recommendations * RANKING_OVERSAMPLE))
+
+    candidates = collect_candidates(food_experiences)
+    preferences = split_terms(user_profile.food_preferences) + split_terms(
+        user_profile.diet_preferences
+    )
+    scores = score_candidates(candidates, preferences, user_profile.budget, FOOD_WEIGHTS)
+    keep = top_k_ids(candidates, scores, k)
+
+    print(f"[RANKING] Kept {len(keep)} of {len(candidates)} food candidates")
+    return {
+        category: [p for p in places if p["id"] in keep]
+        for category, places in food_experiences.items()
+    }
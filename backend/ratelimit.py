@@ -0,0 +1,217 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+from metrics import count_error, span
+
+
+# Retries after a 429, 5xx or connection error, on top of the first attempt
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Exponential backoff: a random delay up to base * 2^attempt, capped at max
+RATE_LIMIT_BASE_DELAY_SECONDS = float(os.getenv("RATE_LIMIT_BASE_DELAY_SECONDS", "0.5"))
+RATE_LIMIT_MAX_DELAY_SECONDS = float(os.getenv("RATE_LIMIT_MAX_DELAY_SECONDS", "8"))
+
+# Longest a call waits for its budget or a Retry-After before giving up, so a
+# throttled provider fails the call quickly instead of hanging the request
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "20"))
+
+
+# Seconds from a Retry-After header (delta-seconds or HTTP date), or None
+def retry_after_seconds(response: Optional[httpx.Response]):
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(response: httpx.Response):
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket of `rate` calls per second with bursts of up to `burst`.
+
+    Calls reserve their token up front and are told how long to wait for it, so
+    sync and async callers share one budget and sleep outside the lock. A rate
+    of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.tolerance = max(0, burst - 1) * self.interval
+        self.lock = threading.Lock()
+        # When the next token is due, and when a Retry-After pause ends
+        self.next_token_at = 0.0
+        self.paused_until = 0.0
+
+    # (granted, seconds to wait for the token). Nothing is reserved if the wait
+    # would be longer than max_wait.
+    def reserve(self, max_wait: float):
+        with self.lock:
+            now = time.monotonic()
+            due = max(self.next_token_at, now, self.paused_until)
+            start = max(now, due - self.tolerance, self.paused_until)
+            wait = start - now
+            if wait > max_wait:
+                return False, wait
+            self.next_token_at = due + self.interval
+            return True, wait
+
+    # Hold every caller back for `seconds`, e.g. after a 429 with Retry-After
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimitExceeded(Exception):
+    """The budget or a Retry-After would make the call wait longer than allowed."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} rate limit, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+        # Read by the API's exception handler and by jobs.py
+        self.status_code = 503
+        self.detail = f"Upstream rate limit reached ({provider}), try again shortly"
+
+
+class ProviderLimiter:
+    """
+    Rate-limit layer for one upstream provider, shared by every request.
+
+    Each attempt takes a token from the provider's QPS budget and is timed as an
+    "upstream" span. A 429, 5xx or connection error is retried with jittered
+    exponential backoff. A Retry-After header sets the delay and pauses the whole
+    provider, so concurrent requests stop sending calls that would be rejected.
+    The last response is returned as is once retries run out.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        qps: float,
+        burst: int,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+    ):
+        self.provider = provider
+        self.bucket = TokenBucket(qps, burst)
+        self.max_retries = max_retries
+
+    @classmethod
+    def from_env(
+        cls, provider: str, prefix: str, default_qps: float, default_burst: int
+    ):
+        return cls(
+            provider,
+            qps=float(os.getenv(f"{prefix}_QPS", str(default_qps))),
+            burst=int(os.getenv(f"{prefix}_BURST", str(default_burst))),
+        )
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response]):
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return retry_after
+        ceiling = min(
+            RATE_LIMIT_MAX_DELAY_SECONDS, RATE_LIMIT_BASE_DELAY_SECONDS * 2**attempt
+        )
+        return random.uniform(0, ceiling)
+
+    def reserve(self, operation: str):
+        granted, wait = self.bucket.reserve(RATE_LIMIT_MAX_WAIT_SECONDS)
+        if not granted:
+            count_error(
+                "upstream", "rate_limited", provider=self.provider, operation=operation
+            )
+            raise RateLimitExceeded(self.provider, wait)
+        return wait
+
+    # Delay before the next attempt, or None to stop retrying
+    def retry_delay(
+        self, operation: str, attempt: int, response: Optional[httpx.Response], error
+    ):
+        delay = self.backoff(attempt, response)
+        if response is not None and response.status_code == 429:
+            # Even when this call gives up, nobody else should try before then
+            self.bucket.pause(delay)
+        if attempt >= self.max_retries or delay > RATE_LIMIT_MAX_WAIT_SECONDS:
+            return None
+        if response is not None:
+            reason = f"retry_http_{response.status_code}"
+        else:
+            reason = "retry_connection"
+        count_error("upstream", reason, provider=self.provider, operation=operation)
+        print(
+            f"[RATE LIMIT] {self.provider} {operation}: "
+            f"{response.status_code if response is not None else repr(error)}, "
+            f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+        )
+        return delay
+
+    # Send through the limiter: send(*args, **kwargs) must return an httpx.Response
+    def call(self, operation: str, send, *args, **kwargs):
+        attempt = 0
+        while True:
+            time.sleep(self.reserve(operation))
+            response = error = None
+            try:
+                with span("upstream", provider=self.provider, operation=operation):
+                    response = send(*args, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and not is_retryable(response):
+                return response
+            delay = self.retry_delay(operation, attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, operation: str, send, *args, **kwargs):
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.reserve(operation))
+            response = error = None
+            try:
+                with span("upstream", provider=self.provider, operation=operation):
+                    response = await send(*args, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and not is_retryable(response):
+                return response
+            delay = self.retry_delay(operation, attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # A 429 the client already retried: still pause the provider for its Retry-After
+    def throttled(self, response: Optional[httpx.Response]):
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            self.bucket.pause(min(retry_after, RATE_LIMIT_MAX_WAIT_SECONDS))
+
+    # Budget only, for clients that retry on their own (the OpenAI SDK)
+    def wait(self, operation: str):
+        time.sleep(self.reserve(operation))
+
+    async def wait_async(self, operation: str):
+        await asyncio.sleep(self.reserve(operation))
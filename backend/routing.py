@@ -0,0 +1,166 @@
+import itertools
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from scheduler import EVENING_KEYWORDS, time_to_minutes
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Days with at most this many flexible items are solved exactly, larger ones with
+# swap / reversal local search
+ROUTE_EXACT_MAX_ITEMS = int(os.getenv("ROUTE_EXACT_MAX_ITEMS", "8"))
+
+# Items only move between slots of their own part of the day: daytime stops swap
+# freely between morning and afternoon, evening slots only trade with each other
+EVENING_START_MINUTES = 17 * 60
+DAYPART_STARTS = (0, EVENING_START_MINUTES, 24 * 60)
+
+
+# Pairwise great-circle distances in km. Rows/columns with missing coordinates are 0,
+# so items without lat/lng do not pull the route anywhere.
+def haversine_matrix(lats, lngs):
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    )
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.nan_to_num(distances, nan=0.0)
+
+
+def item_distance_matrix(items: list):
+    lats = [np.nan if item.get("lat") is None else item["lat"] for item in items]
+    lngs = [np.nan if item.get("lng") is None else item["lng"] for item in items]
+    return haversine_matrix(lats, lngs)
+
+
+# Total length of each route; orders is (routes, stops) of indexes into dist
+def route_costs(dist, orders):
+    return dist[orders[:, :-1], orders[:, 1:]].sum(axis=1)
+
+
+def route_length_km(items: list) -> float:
+    if len(items) < 2:
+        return 0.0
+    dist = item_distance_matrix(items)
+    return float(route_costs(dist, np.arange(len(items))[None, :])[0])
+
+
+# (earliest, latest) start in minutes after midnight an item may be moved to: the
+# daytime or evening window of its current slot. Evening-type items (bars, shows, ...)
+# scheduled in daytime also never move earlier than their current slot.
+def start_window(item, minutes: float):
+    for start, end in zip(DAYPART_STARTS, DAYPART_STARTS[1:]):
+        if minutes < end:
+            break
+    title = (item.get("title") or "").lower()
+    if any(keyword in title for keyword in EVENING_KEYWORDS):
+        start = max(start, min(minutes, EVENING_START_MINUTES))
+    return start, end - 1
+
+
+@lru_cache(maxsize=None)
+def permutations(k: int):
+    return np.array(list(itertools.permutations(range(k))), dtype=np.intp)
+
+
+# Swap and segment-reversal neighbours of one order of flexible items
+def neighbours(order):
+    k = len(order)
+    moves = []
+    for i, j in itertools.combinations(range(k), 2):
+        swapped = order.copy()
+        swapped[[i, j]] = swapped[[j, i]]
+        moves.append(swapped)
+        if j - i > 1:
+            reversed_segment = order.copy()
+            reversed_segment[i : j + 1] = order[i : j + 1][::-1]
+            moves.append(reversed_segment)
+    return np.array(moves, dtype=np.intp)
+
+
+def order_day_items(items: list):
+    """
+    Reorder one day's flexible items to shorten the walk between them.
+
+    Fixed-time items, and items whose time cannot be parsed, stay where they are
+    and keep their time. Flexible items are permuted over the remaining positions
+    and take the time of the slot they land in, but only within their own part of
+    the day (see start_window): a daytime museum never trades places with an
+    evening cruise. The current order wins ties, and the day is returned unchanged if
+    nothing shorter and allowed exists.
+    """
+    minutes = [time_to_minutes(item.get("time")) for item in items]
+    located = [
+        i
+        for i, item in enumerate(items)
+        if not item.get("time_is_fixed")
+        and item.get("lat") is not None
+        and minutes[i] is not None
+    ]
+    if len(located) < 2:
+        return items
+
+    dist = item_distance_matrix(items)
+    positions = np.array(located, dtype=np.intp)
+    windows = np.array([start_window(items[i], minutes[i]) for i in located])
+    earliest, latest = windows[:, 0], windows[:, 1]
+    slot_minutes = np.array([minutes[i] for i in located], dtype=float)
+
+    def evaluate(orders):
+        routes = np.tile(np.arange(len(items), dtype=np.intp), (len(orders), 1))
+        routes[:, positions] = positions[orders]
+        costs = route_costs(dist, routes)
+        feasible = np.all(
+            (earliest[orders] <= slot_minutes[None, :])
+            & (slot_minutes[None, :] <= latest[orders]),
+            axis=1,
+        )
+        return np.where(feasible, costs, np.inf)
+
+    identity = np.arange(len(located), dtype=np.intp)
+    if len(located) <= ROUTE_EXACT_MAX_ITEMS:
+        # Row 0 of permutations() is the identity, so argmin keeps the current order on ties
+        orders = permutations(len(located))
+        costs = evaluate(orders)
+        best = int(np.argmin(costs))
+        best_order, best_cost = orders[best], costs[best]
+    else:
+        best_order, best_cost = identity, evaluate(identity[None, :])[0]
+        while True:
+            candidates = neighbours(best_order)
+            costs = evaluate(candidates)
+            i = int(np.argmin(costs))
+            if not costs[i] < best_cost - 1e-9:
+                break
+            best_order, best_cost = candidates[i], costs[i]
+
+    if not np.isfinite(best_cost) or np.array_equal(best_order, identity):
+        return items
+
+    reordered = list(items)
+    for slot, chosen in zip(located, best_order):
+        moved = dict(items[located[chosen]])
+        moved["time"] = items[slot].get("time")
+        reordered[slot] = moved
+    return reordered
+
+
+# Reorder the flexible items of every day in place. Items need lat/lng
+# (see attach_itinerary_coordinates); days without them are left alone.
+def optimize_itinerary_routes(itinerary: dict):
+    for day in itinerary.get("itinerary", []):
+        before = route_length_km(day["items"])
+        day["items"] = order_day_items(day["items"])
+        after = route_length_km(day["items"])
+        if after < before:
+            print(
+                f"[ROUTING] Day {day.get('day_id')}: {before:.1f} km -> {after:.1f} km"
+            )
+    return itinerary
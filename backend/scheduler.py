@@ -0,0 +1,168 @@
+from datetime import date, timedelta
+
+from ranking import daily_quota, rank_event_candidates
+
+
+# Default start times for flexible items, by number of items per day
+SLOT_TIMES = {
+    1: ["10:00 AM"],
+    2: ["10:00 AM", "3:00 PM"],
+    3: ["10:00 AM", "1:30 PM", "7:00 PM"],
+    4: ["9:00 AM", "12:00 PM", "3:30 PM", "7:30 PM"],
+}
+
+# Items matching these words go in the latest free slot of the day
+EVENING_KEYWORDS = (
+    "nightlife",
+    "night",
+    "bar",
+    "club",
+    "concert",
+    "show",
+    "theater",
+    "theatre",
+    "jazz",
+    "comedy",
+)
+
+
+def trip_dates(start_date, end_date):
+    start = date.fromisoformat(str(start_date)[:10])
+    end = date.fromisoformat(str(end_date)[:10])
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+# "19:30:00", "19:30" or "7:30 PM" -> minutes after midnight
+def time_to_minutes(value: str):
+    if not value:
+        return None
+    text = value.strip().upper()
+    suffix = None
+    if text.endswith("AM") or text.endswith("PM"):
+        suffix = text[-2:]
+        text = text[:-2].strip()
+    try:
+        parts = [int(p) for p in text.split(":")]
+    except ValueError:
+        return None
+    hours, minutes = parts[0], parts[1] if len(parts) > 1 else 0
+    if suffix == "PM" and hours != 12:
+        hours += 12
+    if suffix == "AM" and hours == 12:
+        hours = 0
+    return hours * 60 + minutes
+
+
+def is_evening(candidate) -> bool:
+    text = " ".join(
+        [candidate["place"].get("title") or "", *candidate["categories"]]
+    ).lower()
+    return any(keyword in text for keyword in EVENING_KEYWORDS)
+
+
+def build_item(candidate, time: str):
+    place = candidate["place"]
+    return {
+        "id": place["id"],
+        "time": time,
+        "time_is_fixed": bool(place.get("time_is_fixed")),
+        "title": place.get("title", ""),
+        "type": "event",
+        "source": place.get("source", "Google"),
+        "address": place.get("address", ""),
+        "url": place.get("url") or "",
+        "explanation": "",
+    }
+
+
+# Give each flexible item one of the day's slot times, skipping slots taken by
+# fixed-time items and putting evening-type items in the latest free slots
+def assign_slot_times(fixed, flexible, quota: int):
+    taken = [time_to_minutes(c["place"].get("time")) for c in fixed]
+    slots = list(SLOT_TIMES.get(quota, SLOT_TIMES[4]))
+    for minutes in taken:
+        if minutes is None or not slots:
+            continue
+        closest = min(slots, key=lambda s: abs(time_to_minutes(s) - minutes))
+        slots.remove(closest)
+    slots = slots[: len(flexible)]
+
+    evening = [c for c in flexible if is_evening(c)]
+    daytime = [c for c in flexible if not is_evening(c)]
+    ordered = daytime + evening
+    return [(c, slot) for c, slot in zip(ordered, slots)]
+
+
+def schedule_itinerary(events: dict, user_profile, start_date, end_date):
+    """
+    Assign ranked candidates to days and time slots without the LLM.
+    Fixed-time Ticketmaster events keep their exact time on their own date, each day
+    gets exactly the pace quota when enough candidates exist, nothing repeats, and
+    items are ordered morning -> evening. Explanations are left empty.
+    """
+    dates = trip_dates(start_date, end_date)
+    quota = daily_quota(user_profile.preferred_pace)
+    ranked = [candidate for candidate, _ in rank_event_candidates(events, user_profile)]
+
+    fixed_by_day = {d: [] for d in dates}
+    flexible_by_day = {d: [] for d in dates}
+    used = set()
+
+    # Fixed-time events first, on the day they happen
+    for candidate in ranked:
+        place = candidate["place"]
+        if not place.get("time_is_fixed"):
+            continue
+        day = place.get("startDate")
+        if day in fixed_by_day and len(fixed_by_day[day]) < quota:
+            fixed_by_day[day].append(candidate)
+            used.add(place["id"])
+
+    # Then the best flexible candidates, each to the day with the most open slots.
+    # A few iconic attractions go first so every trip includes some.
+    flexible = [c for c in ranked if not c["place"].get("time_is_fixed")]
+    famous = [c for c in flexible if "famous_attractions" in c["categories"]]
+    reserved = famous[: max(1, len(dates) // 2)]
+    flexible = reserved + [c for c in flexible if c not in reserved]
+
+    for candidate in flexible:
+        place = candidate["place"]
+        if place["id"] in used:
+            continue
+        open_days = [
+            d
+            for d in dates
+            if len(fixed_by_day[d]) + len(flexible_by_day[d]) < quota
+        ]
+        if not open_days:
+            break
+        day = max(
+            open_days,
+            key=lambda d: quota - len(fixed_by_day[d]) - len(flexible_by_day[d]),
+        )
+        flexible_by_day[day].append(candidate)
+        used.add(place["id"])
+
+    itinerary = []
+    for day_id, day in enumerate(dates, start=1):
+        items = [
+            build_item(c, c["place"].get("time")) for c in fixed_by_day[day]
+        ] + [
+            build_item(c, slot)
+            for c, slot in assign_slot_times(
+                fixed_by_day[day], flexible_by_day[day], quota
+            )
+        ]
+        items.sort(key=lambda item: time_to_minutes(item["time"]) or 0)
+        itinerary.append({"day_id": day_id, "date": day, "items": items})
+
+    return {"itinerary": itinerary}
+
+
+# Short fallback when the LLM does not return an explanation for an item
+def default_explanation(item) -> str:
+    if item["time_is_fixed"]:
+        return "This live event happens during your trip, so I locked it in at its scheduled time."
+    return "This spot is one of the best matches for your interests in the area."
@@ -0,0 +1,111 @@
+import json
+
+
+class ItineraryStreamParser:
+    """
+    Incrementally scans streamed LLM output shaped like {"itinerary": [{..., "items": [...]}]}
+    and returns each item and each day object as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = 0
+        self.last_string = None
+        # One frame per open container: {"type", "start", "key", "count", "current_key"}
+        self.stack = []
+
+    def feed(self, chunk: str):
+        """Consume the next chunk of text and return the list of newly completed events."""
+        self.text += chunk
+        events = []
+
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = self.text[self.string_start + 1 : self.pos]
+                self.pos += 1
+                continue
+
+            if char == '"' and self.stack:
+                self.in_string = True
+                self.string_start = self.pos
+            elif char == ":" and self.stack and self.stack[-1]["type"] == "{":
+                self.stack[-1]["current_key"] = self.last_string
+            elif char in "{[":
+                # Anything before the root object (e.g. a ```json fence) is ignored
+                if char == "[" and not self.stack:
+                    self.pos += 1
+                    continue
+                parent = self.stack[-1] if self.stack else None
+                key = parent["current_key"] if parent and parent["type"] == "{" else None
+                self.stack.append(
+                    {
+                        "type": char,
+                        "start": self.pos,
+                        "key": key,
+                        "count": 0,
+                        "current_key": None,
+                    }
+                )
+            elif char in "}]" and self.stack:
+                frame = self.stack.pop()
+                event = self._completed(frame, char)
+                if event is not None:
+                    events.append(event)
+                if self.stack and self.stack[-1]["type"] == "[":
+                    self.stack[-1]["count"] += 1
+
+            self.pos += 1
+
+        return events
+
+    def _completed(self, frame, char):
+        if char != "}" or len(self.stack) < 2:
+            return None
+        if self.stack[1]["key"] != "itinerary":
+            return None
+
+        # root { -> "itinerary" [ -> day {
+        if len(self.stack) == 2:
+            day = self._load(frame["start"])
+            if day is None:
+                return None
+            return ("day", {"index": self.stack[1]["count"], "day": day})
+
+        # root { -> "itinerary" [ -> day { -> "items" [ -> item {
+        if len(self.stack) == 4 and self.stack[3]["key"] == "items":
+            item = self._load(frame["start"])
+            if item is None:
+                return None
+            day_frame = self.stack[2]
+            # The day's own fields (day_id, date) are usually written before "items"
+            day_header = self._load(day_frame["start"], self.stack[3]["start"], "[]}")
+            return (
+                "item",
+                {
+                    "day_index": self.stack[1]["count"],
+                    "day_id": (day_header or {}).get("day_id"),
+                    "date": (day_header or {}).get("date"),
+                    "index": self.stack[3]["count"],
+                    "item": item,
+                },
+            )
+
+        return None
+
+    def _load(self, start: int, end: int = None, suffix: str = ""):
+        end = self.pos + 1 if end is None else end
+        try:
+            return json.loads(self.text[start:end] + suffix)
+        except ValueError:
+            return None
@@ -5,6 +5,8 @@ type RoutesByMode = {
   [mode: string]: any;
 };
 
+type LatLng = { lat: number; lng: number };
+
 export const TimeDisplay: React.FC<{ tz: string }> = ({ tz }) => {
   const [time, setTime] = useState("");
   useEffect(() => {
@@ -33,7 +35,7 @@ interface RoutePanelProps {
   setRouteLegs: (l: any[]) => void;
   budget: string;
   setBudget: (v: string) => void;
-  setCoords: (c: { lat: number; lng: number }[]) => void;
+  setCoords: (c: LatLng[]) => void;
   originTimezone: string;
   setOriginTimezone: (tz: string) => void;
   destinationTimezones: string[];
@@ -59,6 +61,10 @@ const RoutePanel: React.FC<RoutePanelProps> = ({
 }) => {
   const [newDest, setNewDest] = useState("");
   const [loading, setLoading] = useState(false);
+  // Stops the geocoder could not place on the last plan
+  const [unavailable, setUnavailable] = useState<string[]>([]);
+  // Stops already geocoded, so re-planning only looks up new ones
+  const knownCoords = useRef<Record<string, LatLng>>({});
   const inputRef = useRef<HTMLInputElement>(null);
   const focusOrigin = () => inputRef.current?.focus();
 
@@ -82,19 +88,24 @@ const RoutePanel: React.FC<RoutePanelProps> = ({
 
     try {
       const all = [origin, ...destinations];
-      const coords = (
-        await Promise.all(
-          all.map(async (a) => {
-            const res = await fetchData("http://127.0.0.1:8000/geocode", {
-              address: a,
-            });
-            return res.results?.[0]?.geometry?.location || null;
-          })
-        )
-      ).filter(Boolean);
 
+      // Every stop without coordinates in one request; unresolved ones come back null
+      const missing = all.filter((a) => !knownCoords.current[a]);
+      if (missing.length) {
+        const { data } = await axios.post<Record<string, LatLng | null>>(
+          "http://127.0.0.1:8000/geocode/batch",
+          { addresses: missing }
+        );
+        missing.forEach((a) => {
+          if (data[a]) knownCoords.current[a] = data[a] as LatLng;
+        });
+      }
+      const located = all.map((a) => knownCoords.current[a] || null);
+      setUnavailable(all.filter((_, i) => !located[i]));
+
+      const coords = located.filter(Boolean) as LatLng[];
       setCoords(coords);
-      const [_, ...destCoords] = coords;
+      const destCoords = located.slice(1).filter(Boolean) as LatLng[];
 
       const modesToFetch = ["DRIVE", "TRANSIT", "BICYCLE", "WALK"];
       const routesData: RoutesByMode = {};
@@ -147,7 +158,8 @@ const RoutePanel: React.FC<RoutePanelProps> = ({
       }
 
       const allTz = await Promise.all(
-        coords.map(async (c) => {
+        located.map(async (c) => {
+          if (!c) return "Unknown";
           const res = await fetchData("http://127.0.0.1:8000/timezone", {
             lat: c.lat,
             lng: c.lng,
@@ -179,6 +191,9 @@ const RoutePanel: React.FC<RoutePanelProps> = ({
           placeholder="Enter starting point"
           className="w-full px-3 py-2 border rounded-lg focus:ring-2 focus:ring-blue-200 outline-none"
         />
+        {unavailable.includes(origin) && (
+          <p className="text-sm text-red-500 mt-1">Location unavailable</p>
+        )}
         {originTimezone !== "Unknown" && (
           <p className="text-sm text-gray-500 mt-1">
             Local Time: <TimeDisplay tz={originTimezone} />
@@ -214,6 +229,9 @@ const RoutePanel: React.FC<RoutePanelProps> = ({
           {destinations.map((d, i) => (
             <p key={i} className="text-gray-600">
               {d}{" "}
+              {unavailable.includes(d) && (
+                <small className="ml-2 text-red-500">Location unavailable</small>
+              )}
               {destinationTimezones[i] &&
                 destinationTimezones[i] !== "Unknown" && (
                   <small className="ml-2 text-gray-500">
@@ -38,6 +38,8 @@ export default function CreateItinerary() {
     explanation: string;
     address: string;
     url: string;
+    lat?: number | null;
+    lng?: number | null;
   };
 
   type ItineraryDay = {
@@ -47,6 +49,7 @@ export default function CreateItinerary() {
 
   // Backend States
   const [itinerary, setItinerary] = useState<ItineraryDay[] | null>(null);
+  const [poolId, setPoolId] = useState<string | null>(null);
   const [foodOptions, setFoodOptions] = useState<any>(null);
   const [tabs, setTabs] = useState<string[]>([]);
   const [selectedTab, setSelectedTab] = useState<string | null>(null);
@@ -161,23 +164,6 @@ export default function CreateItinerary() {
     }
   };
 
-  const geocodeAddress = async (address: string) => {
-    try {
-      const res = await fetch(
-        `${
-          import.meta.env.VITE_API_BASE_URL
-        }/geocode?address=${encodeURIComponent(address)}`
-      );
-      const data = await res.json();
-
-      const loc = data.results[0].geometry.location;
-      return { lat: loc.lat, lng: loc.lng };
-    } catch (e) {
-      console.error("Geocode failed:", e);
-      return { lat: null, lng: null };
-    }
-  };
-
   const submitTripQuery = async () => {
     setShowGuestMenu(false);
     setShowResults(false);
@@ -194,11 +180,10 @@ export default function CreateItinerary() {
       return;
     }
 
-    // Get itinerary
-
+    // Get itinerary and food options in one request; the backend generates both at once
     try {
       const response = await fetch(
-        `${import.meta.env.VITE_API_BASE_URL}/generate-itinerary`,
+        `${import.meta.env.VITE_API_BASE_URL}/generate-trip`,
         {
           method: "POST",
           headers: { "Content-Type": "application/json" },
@@ -208,14 +193,17 @@ export default function CreateItinerary() {
             start_date: checkInDate,
             end_date: checkOutDate,
             num_guests: `${guests.adults} adults, ${guests.children} children, ${guests.infants} infants, ${guests.pets} pets`,
+            include_coordinates: true,
           }),
         }
       );
 
       const result = await response.json();
-      console.log("ITINERARY:", result);
+      console.log("TRIP:", result);
 
       setItinerary(result.itinerary);
+      setPoolId(result.pool_id ?? null);
+      setFoodOptions(result.food_recommendations);
       const loadedDates = result.itinerary.map((d: any) => d.date);
       setTabs([...loadedDates, "Food"]);
       setSelectedTab(loadedDates[0]);
@@ -225,32 +213,6 @@ export default function CreateItinerary() {
       console.error(error);
       alert("Itinerary could not be generated!");
     }
-
-    // Get food options
-    try {
-      const response = await fetch(
-        `${import.meta.env.VITE_API_BASE_URL}/generate-food`,
-        {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            user_id: user.id,
-            destination: destination,
-            start_date: checkInDate,
-            end_date: checkOutDate,
-            num_guests: `${guests.adults} adults, ${guests.children} children, ${guests.infants} infants, ${guests.pets} pets`,
-          }),
-        }
-      );
-
-      const result = await response.json();
-      console.log("FOOD:", result);
-
-      setFoodOptions(result.food_recommendations);
-    } catch (error) {
-      console.error(error);
-      alert("Error generating food recommendations");
-    }
   };
 
   // Icons
@@ -356,6 +318,8 @@ export default function CreateItinerary() {
             chat_messages: messages,
             approvals: approvalResults,
             previous_itinerary: itinerary,
+            pool_id: poolId,
+            include_coordinates: true,
           }),
         }
       );
@@ -364,6 +328,7 @@ export default function CreateItinerary() {
       console.log("REGENERATED ITINERARY:", result);
 
       setItinerary(result.itinerary);
+      setPoolId(result.pool_id ?? null);
       setSelections({}); // reset selection states
       setLoading(false);
       setShowResults(true);
@@ -392,122 +357,43 @@ export default function CreateItinerary() {
       return;
     }
 
-    // 1️⃣ Create main itinerary row
-    const { data: itineraryRow, error: itineraryErr } = await supabase
-      .from("itineraries")
-      .insert({
-        user_id: user.id,
-        title: `${destination} Trip`,
-        destination,
-        start_date: checkInDate,
-        end_date: checkOutDate,
-        num_guests: `${guests.adults} adults, ${guests.children} children, ${guests.infants} infants, ${guests.pets} pets`,
-      })
-      .select()
-      .single();
-
-    if (itineraryErr) {
-      console.error(itineraryErr);
-      alert("Error saving itinerary");
-      setIsSaving(false);
-      return;
-    }
-
-    const itineraryId = itineraryRow.id;
-
-    // 2️⃣ Insert all days
-    const dayRowsPayload = itinerary.map((day, index) => ({
-      itinerary_id: itineraryId,
-      day_number: index + 1,
-      date: day.date,
-      notes: "",
-    }));
-
-    const { data: dayRows, error: dayErr } = await supabase
-      .from("itinerary_days")
-      .insert(dayRowsPayload)
-      .select();
-
-    if (dayErr) {
-      console.error(dayErr);
-      alert("Error saving itinerary days");
-      setIsSaving(false);
-      return;
-    }
-
-    // Build map: date → day_id
-    const dayIdMap = new Map();
-    dayRows.forEach((d) => dayIdMap.set(d.date, d.id));
-
-    const allActivities = [];
-
-    for (const day of itinerary) {
-      for (const item of day.items) {
-        const coords = await geocodeAddress(item.address);
-
-        allActivities.push({
-          day_id: dayIdMap.get(day.date),
-          name: item.title,
-          category: null,
-          location_name: null,
-          location_address: item.address,
-          description: item.explanation,
-          cost: null,
-          start_time: null,
-          end_time: null,
-          latitude: coords.lat,
-          longitude: coords.lng,
-          booking_url: item.url,
-          place_id: null,
-          is_fixed: true,
-        });
-      }
-    }
-
-    const { error: actErr } = await supabase
-      .from("activities")
-      .insert(allActivities);
+    // Itinerary, days, activities and food options are written in one backend request,
+    // as this user: the backend writes with their access token
+    const {
+      data: { session },
+    } = await supabase.auth.getSession();
 
-    if (actErr) {
-      console.error(actErr);
-      alert("Error saving activities");
+    let itineraryId;
+    try {
+      const response = await fetch(
+        `${import.meta.env.VITE_API_BASE_URL}/save-itinerary`,
+        {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: `Bearer ${session?.access_token ?? ""}`,
+          },
+          body: JSON.stringify({
+            user_id: user.id,
+            destination,
+            start_date: checkInDate,
+            end_date: checkOutDate,
+            num_guests: `${guests.adults} adults, ${guests.children} children, ${guests.infants} infants, ${guests.pets} pets`,
+            itinerary,
+            food_recommendations: foodOptions ?? [],
+          }),
+        }
+      );
+      if (!response.ok) throw new Error(`Save failed: ${response.status}`);
+      const result = await response.json();
+      itineraryId = result.itinerary_id;
+    } catch (error) {
+      console.error(error);
+      alert("Error saving itinerary");
       setIsSaving(false);
       return;
     }
 
-    // 3️⃣ SAVE FOOD OPTIONS
-    if (foodOptions && foodOptions.length > 0) {
-      const foodInsertPayload = [];
-
-      for (const place of foodOptions) {
-        const coords = await geocodeAddress(place.address);
-
-        foodInsertPayload.push({
-          user_id: user.id,
-          itinerary_id: itineraryId,
-          name: place.title,
-          address: place.address,
-          rating: place.rating,
-          price_level: place.priceLevel,
-          url: place.url,
-          explanation: place.explanation,
-          latitude: coords.lat?.toString() ?? null,
-          longitude: coords.lng?.toString() ?? null,
-        });
-      }
-
-      const { error: foodErr } = await supabase
-        .from("food_options")
-        .insert(foodInsertPayload);
-
-      if (foodErr) {
-        console.error(foodErr);
-        alert("Error saving food options");
-        setIsSaving(false);
-        return;
-      }
-    }
-
     setShowSavedModal(true);
     setIsSaving(false);
 
@@ -59,11 +59,18 @@ export default function EditItinerary() {
   const fetchItinerary = async (userId: string) => {
     setLoading(true);
 
+    // Last response for this itinerary; the backend answers 304 if it is unchanged
+    const cacheKey = `itinerary:${userId}:${itinerary_id}`;
+    const cached = JSON.parse(sessionStorage.getItem(cacheKey) ?? "null");
+
     const response = await fetch(
       `${import.meta.env.VITE_API_BASE_URL}/fetch-itinerary`,
       {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(cached ? { "If-None-Match": cached.etag } : {}),
+        },
         body: JSON.stringify({
           itinerary_id,
           user_id: userId,
@@ -73,7 +80,16 @@ export default function EditItinerary() {
 
     console.log(guests);
 
-    const result = await response.json();
+    let result;
+    if (response.status === 304 && cached) {
+      result = cached.result;
+    } else {
+      result = await response.json();
+      const etag = response.headers.get("ETag");
+      if (response.ok && etag) {
+        sessionStorage.setItem(cacheKey, JSON.stringify({ etag, result }));
+      }
+    }
     console.log("FETCHED ITINERARY:", result);
 
     if (!result || !result.itinerary || result.itinerary.length === 0) {
@@ -378,6 +394,13 @@ export default function EditItinerary() {
       return;
     }
 
+    // Drop the backend's cached copy so the next fetch returns the edited itinerary
+    fetch(`${import.meta.env.VITE_API_BASE_URL}/invalidate-itinerary`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ user_id: user?.id, itinerary_id }),
+    }).catch((e) => console.error("Itinerary cache invalidation failed:", e));
+
     setShowSavedModal(true);
 
     setTimeout(() => {
@@ -116,6 +116,13 @@ const Profile = () => {
       .eq("user_id", user.id);
 
     if (!error) {
+      // Drop the backend's cached profile so the next generation sees the change
+      fetch(`${import.meta.env.VITE_API_BASE_URL}/invalidate-profile`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ user_id: user.id }),
+      }).catch((e) => console.error("Profile cache invalidation failed:", e));
+
       setPreferences((prev) => ({
         ...prev,
         age_range: ageRange,